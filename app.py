@@ -1,74 +1,168 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, current_app, stream_with_context
 from flask_bcrypt import Bcrypt
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import jwt
+import hmac
+import importlib
+import json
+import time
 from datetime import datetime
 from functools import wraps
-import speech_recognition as sr
-from pydub import AudioSegment
 import os
 from config import Config
-from models import db, User, APIKey, RequestLog
-from werkzeug.utils import secure_filename
-
-app = Flask(__name__)
-CORS(app)
-app.config.from_object(Config)
-db.init_app(app)
-bcrypt = Bcrypt(app)
-limiter = Limiter(
-    app=app,
-    key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"]
+from models import db, read_db, User, APIKey, RequestLog
+from audio import (
+    AudioUploadRequest, audio_format, upload_size, decode_audio, probe_duration,
+    check_duration, content_digest
 )
+from jobs import JobManager
+from cache import TranscriptionCache
+from resources import WorkerResources
+from batch import ArchiveError, extract_archive, get_batch_pool
+from auth import APIKeyCache, CachedKey, new_api_key
+from ratelimit import QuotaLimiter, create_quota_store
+from logwriter import RequestLogWriter
+from metrics import (
+    timed, server_timing, render, RESPONSES, AUDIO_SECONDS, AUDIO_BYTES, PREPROCESS_BYTES_SAVED, CACHE_LOOKUPS
+)
+from usage import monthly_usage
+from plans import SUBSCRIPTION_LIMITS, PLAN_MAX_UPLOAD_SIZE, PLAN_MAX_DURATION
+
+# Modules that decode, preprocess and recognize audio, and pull in pydub, speech_recognition,
+# NumPy and requests; they are imported when a request first needs them, so the app and the
+# scripts start without them, or up front by preload_audio_modules()
+AUDIO_MODULES = ('recognition', 'preprocess', 'streaming', 'backends')
+
+bcrypt = Bcrypt()
+# Requests authenticated by API key are limited per key by quota_limiter; this per-IP
+# limiter only covers the account endpoints
+limiter = Limiter(key_func=get_remote_address)
+
+api_key_cache = APIKeyCache(ttl=Config.API_KEY_CACHE_TTL, maxsize=Config.API_KEY_CACHE_SIZE)
+quota_limiter = QuotaLimiter(create_quota_store(Config.QUOTA_STORAGE_URI), Config.API_KEY_RATE_LIMITS)
+request_log_writer = RequestLogWriter(
+    batch_size=Config.REQUEST_LOG_BATCH_SIZE,
+    flush_interval=Config.REQUEST_LOG_FLUSH_INTERVAL,
+    max_queue=Config.REQUEST_LOG_QUEUE_SIZE,
+    write_retries=Config.REQUEST_LOG_WRITE_RETRIES,
+    retry_backoff=Config.REQUEST_LOG_RETRY_BACKOFF
+)
+transcription_cache = TranscriptionCache(
+    maxsize=Config.TRANSCRIPTION_CACHE_SIZE,
+    persist=Config.TRANSCRIPTION_CACHE_PERSIST
+)
+worker_resources = WorkerResources()
+job_manager = JobManager(workers=Config.JOB_WORKERS, worker_type=Config.JOB_WORKER_TYPE)
 
-SUBSCRIPTION_LIMITS = {
-    'free': 50,
-    'silver': 500,
-    'gold': 2000
-}
+def load_api_key(api_key):
+    # One query on the read connection resolves both the key and its user
+    row = read_db.query(
+        APIKey.id, User.id, User.email, User.subscription_plan
+    ).outerjoin(User, User.id == APIKey.user_id).filter(APIKey.key == api_key).first()
+    if not row:
+        return None
 
-def require_api_key(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        api_key = request.headers.get('X-API-Key')
-        if not api_key:
-            return jsonify({"error": "No API key provided"}), 401
+    return CachedKey(*row)
 
-        api_key_obj = APIKey.query.filter_by(key=api_key).first()
-        if not api_key_obj:
-            return jsonify({"error": "Invalid API key"}), 401
+def count_monthly_requests(api_key_id, month_start):
+    # Include entries still buffered in the log writer so a re-seed never undercounts
+    return monthly_usage(api_key_id, month_start.date()) + request_log_writer.pending(api_key_id)
 
-        user = db.session.get(User, api_key_obj.user_id)
-        if not user:
-            return jsonify({"error": "Invalid user"}), 401
+def authenticate_request():
+    api_key = request.headers.get('X-API-Key')
+    if not api_key:
+        return None, (jsonify({"error": "No API key provided"}), 401)
 
-        # Check rate limit
-        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        request_count = RequestLog.query.filter(
-            RequestLog.api_key_id == api_key_obj.id,
-            RequestLog.timestamp >= month_start
-        ).count()
+    with timed('auth'):
+        cached = api_key_cache.lookup(api_key, load_api_key)
+    if not cached:
+        return None, (jsonify({"error": "Invalid API key"}), 401)
 
-        if request_count >= SUBSCRIPTION_LIMITS[user.subscription_plan]:
-            return jsonify({"error": "Monthly request limit exceeded"}), 429
+    if cached.user_id is None:
+        return None, (jsonify({"error": "Invalid user"}), 401)
+
+    g.api_key = cached
+    return cached, None
+
+def authenticate_api_key(f):
+    # Like require_api_key, but neither checks nor counts against the monthly quota
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        cached, error = authenticate_request()
+        if error:
+            return error
+        return f(*args, **kwargs)
+    return decorated
 
-        # Log request with user email
-        log = RequestLog(
-            api_key_id=api_key_obj.id,
-            user_id=user.id,
-            user_email=user.email,
-            endpoint=request.endpoint
+def upload_too_large():
+    return jsonify({
+        "error": "File too large",
+        "message": f"Uploads are limited to {request.max_content_length} bytes"
+    }), 413
+
+def request_entity_too_large(e):
+    return upload_too_large()
+
+def limit_upload_size(cached):
+    # Runs before the body is read: a declared Content-Length over the plan's limit is rejected
+    # right away, and chunked bodies are cut off by the request's upload stream once they pass it
+    g.max_upload_size = PLAN_MAX_UPLOAD_SIZE[cached.subscription_plan]
+    if request.content_length is not None and request.content_length > request.max_content_length:
+        return upload_too_large()
+    return None
+
+def charge_request(cached, count=1):
+    # Check rate limits and the monthly quota; the HTTP request counts once against the rate
+    # limits and `count` transcriptions against the quota, all charged together or not at all
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    with timed('quota'):
+        exceeded = quota_limiter.hit(
+            cached.api_key_id,
+            SUBSCRIPTION_LIMITS[cached.subscription_plan],
+            month_start,
+            lambda: count_monthly_requests(cached.api_key_id, month_start),
+            count
         )
-        db.session.add(log)
-        db.session.commit()
+    if exceeded is not None:
+        if exceeded.name == 'monthly':
+            return jsonify({"error": "Monthly request limit exceeded"}), 429
+        response = jsonify({"error": "Rate limit exceeded", "message": f"Limit of {exceeded.name}"})
+        response.headers['Retry-After'] = str(max(1, int(exceeded.expires_at - time.time())))
+        return response, 429
+
+    # Log request with user email; the rows are written in the background
+    with timed('log'):
+        request_log_writer.submit(
+            api_key_id=cached.api_key_id,
+            user_id=cached.user_id,
+            user_email=cached.user_email,
+            endpoint=request.endpoint,
+            count=count
+        )
+    return None
+
+def require_api_key(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        cached, error = authenticate_request()
+        if error:
+            return error
+
+        error = limit_upload_size(cached)
+        if error:
+            return error
+
+        error = charge_request(cached)
+        if error:
+            return error
 
         return f(*args, **kwargs)
     return decorated
 
-@app.route('/register', methods=['POST'])
+@limiter.limit(Config.ACCOUNT_RATE_LIMITS)
 def register():
     data = request.get_json()
     if not data or 'email' not in data or 'subscription_plan' not in data:
@@ -79,7 +173,7 @@ def register():
 
     jwt_token = jwt.encode(
         {'email': data['email']},
-        app.config['JWT_SECRET_KEY'],
+        current_app.config['JWT_SECRET_KEY'],
         algorithm='HS256'
     )
 
@@ -89,7 +183,7 @@ def register():
 
     return jsonify({"message": "User registered successfully", "token": jwt_token})
 
-@app.route('/generate-api-key', methods=['POST'])
+@limiter.limit(Config.ACCOUNT_RATE_LIMITS)
 def generate_api_key():
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
@@ -97,17 +191,16 @@ def generate_api_key():
 
     token = auth_header.split(' ')[1]
     try:
-        payload = jwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
+        payload = jwt.decode(token, current_app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
         user = User.query.filter_by(jwt_token=token).first()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        import string
-        import random
-        api_key = ''.join(random.choices(string.ascii_letters + string.digits, k=50))
+        api_key = new_api_key()
         new_key = APIKey(key=api_key, user_id=user.id)
         db.session.add(new_key)
         db.session.commit()
+        api_key_cache.invalidate(api_key)
 
         return jsonify({"api_key": api_key})
     except jwt.ExpiredSignatureError:
@@ -139,104 +232,368 @@ SUPPORTED_LANGUAGES = {
     'thai': 'th-TH'
 }
 
-@app.route('/speech-to-text', methods=['POST'])
-@require_api_key
-def speech_to_text():
-    if 'audio' not in request.files:
-        return jsonify({"error": "No audio file provided"}), 400
+def validate_audio_upload():
+    # Reading the form receives and spools the whole body
+    with timed('upload'):
+        files = request.files
+    if 'audio' not in files:
+        return None, None, (jsonify({"error": "No audio file provided"}), 400)
 
-    audio_file = request.files['audio']
+    audio_file = files['audio']
     if audio_file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
+        return None, None, (jsonify({"error": "No selected file"}), 400)
 
     if not allowed_file(audio_file.filename):
-        return jsonify({"error": "Invalid file type"}), 400
+        return None, None, (jsonify({"error": "Invalid file type"}), 400)
+
+    if audio_format(audio_file) is None:
+        return None, None, (jsonify({"error": "Invalid file type", "message": "The file is not a WAV, MP3, Ogg or FLAC recording"}), 400)
 
     # Get language from request (default to English if not specified)
     language = request.form.get('language', 'english').lower()
-    
-    # Validate language
+    error = validate_language(language)
+    if error:
+        return None, None, error
+
+    return audio_file, language, None
+
+def validate_language(language):
     if language not in SUPPORTED_LANGUAGES:
         return jsonify({
             "error": "Unsupported language",
             "message": f"Please choose from the following languages: {', '.join(SUPPORTED_LANGUAGES.keys())}"
         }), 400
+    return None
+
+def select_backend(requested=None):
+    backend = (requested or current_app.config['RECOGNITION_BACKEND']).lower()
+    if backend not in current_app.config['ALLOWED_RECOGNITION_BACKENDS']:
+        return None, (jsonify({
+            "error": "Unsupported backend",
+            "message": f"Please choose from the following backends: {', '.join(current_app.config['ALLOWED_RECOGNITION_BACKENDS'])}"
+        }), 400)
+    return backend, None
+
+def transcribe_upload(audio_file, language_code, backend, bypass_cache=False, max_duration=None):
+    # Identical audio in the same language is served from the cache unless the client opts out;
+    # callers have already counted the request against the quota. Returns the result, the cache
+    # status and the preprocessing stats (None for cached results)
+    from preprocess import preprocess_audio
+    from recognition import transcribe
+
+    # Results are only shared between plans with the same duration limit, as a cached result
+    # was only checked against the decoded length under the limit of the request that made it
+    digest = content_digest(audio_file, language_code, backend, max_duration)
+    result = None if bypass_cache else transcription_cache.get(digest)
+    if result is not None:
+        CACHE_LOOKUPS.labels('hit').inc()
+        return result, 'HIT', None
+    CACHE_LOOKUPS.labels('bypass' if bypass_cache else 'miss').inc()
+
+    # Refuse long recordings from the header before decoding, as a small compressed file can
+    # expand to far more PCM than the plan allows
+    fmt = audio_format(audio_file)
+    if max_duration is not None:
+        check_duration(probe_duration(audio_file, fmt), max_duration)
+
+    # Decode straight from the request stream into PCM for the recognizer
+    with timed('decode'):
+        sound = decode_audio(audio_file, fmt)
+    AUDIO_BYTES.inc(upload_size(audio_file))
+    AUDIO_SECONDS.inc(len(sound) / 1000)
+    check_duration(len(sound) / 1000, max_duration)
+
+    with timed('preprocess'):
+        sound, preprocessing = preprocess_audio(sound, current_app.config)
+    if preprocessing:
+        PREPROCESS_BYTES_SAVED.inc(max(0, preprocessing['bytes_saved']))
+
+    with timed('recognize'):
+        result = transcribe(
+            sound, language_code, current_app.config, worker_resources.backend(backend, current_app.config),
+            preprocessing['offset_ms'] if preprocessing else 0
+        )
+    transcription_cache.set(digest, result)
+    return result, 'BYPASS' if bypass_cache else 'MISS', preprocessing
+
+@require_api_key
+def speech_to_text():
+    from recognition import error_response
+
+    audio_file, language, error = validate_audio_upload()
+    if error:
+        return error
+
+    backend, error = select_backend(request.form.get('backend'))
+    if error:
+        return error
 
     try:
-        # Secure the filename
-        filename = secure_filename(audio_file.filename)
-        audio_path = os.path.join("uploads", filename)
-        audio_file.save(audio_path)
-
-        # Convert to WAV if necessary
-        if filename.endswith('.mp3'):
-            sound = AudioSegment.from_mp3(audio_path)
-            wav_path = audio_path[:-4] + '.wav'
-            sound.export(wav_path, format="wav")
-            os.remove(audio_path)
-            audio_path = wav_path
-        elif filename.endswith('.ogg'):
-            sound = AudioSegment.from_ogg(audio_path)
-            wav_path = audio_path[:-4] + '.wav'
-            sound.export(wav_path, format="wav")
-            os.remove(audio_path)
-            audio_path = wav_path
-        elif filename.endswith('.flac'):
-            sound = AudioSegment.from_file(audio_path, format="flac")
-            wav_path = audio_path[:-5] + '.wav'
-            sound.export(wav_path, format="wav")
-            os.remove(audio_path)
-            audio_path = wav_path
-
-        # Perform speech recognition
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(audio_path) as source:
-            audio = recognizer.record(source)
-
-        # Get the language code and perform recognition
         language_code = SUPPORTED_LANGUAGES[language]
-        text = recognizer.recognize_google(audio, language=language_code)
-        
-        # Clean up the audio file
-        os.remove(audio_path)
-        
-        return jsonify({
-            "text": text,
+        bypass_cache = 'no-cache' in request.headers.get('Cache-Control', '')
+        result, cache_status, preprocessing = transcribe_upload(
+            audio_file, language_code, backend, bypass_cache, PLAN_MAX_DURATION[g.api_key.subscription_plan]
+        )
+
+        response = jsonify({
+            **result,
             "language": language,
             "language_code": language_code
         })
+        response.headers['X-Cache'] = cache_status
+        if preprocessing:
+            response.headers['X-Audio-Bytes-Saved'] = str(preprocessing['bytes_saved'])
+            response.headers['X-Audio-Preprocess-Time'] = f"{preprocessing['time_ms']:.1f}"
+        return response
 
-    except sr.UnknownValueError:
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-        return jsonify({
-            "error": "Speech recognition failed",
-            "message": "Could not understand the audio content"
-        }), 422
+    except Exception as e:
+        body, status = error_response(e)
+        return jsonify(body), status
+
+def _transcribe_batch_item(app, audio_file, language, backend, bypass_cache, max_duration):
+    from recognition import error_response
+
+    with app.app_context():
+        try:
+            language_code = SUPPORTED_LANGUAGES[language]
+            result, _, _ = transcribe_upload(audio_file, language_code, backend, bypass_cache, max_duration)
+            return {
+                **result,
+                "filename": audio_file.filename,
+                "language": language,
+                "language_code": language_code
+            }
+        except Exception as e:
+            body, status = error_response(e)
+            return {**body, "filename": audio_file.filename, "status": status}
+
+@authenticate_api_key
+def speech_to_text_batch():
+    # Files are charged individually below, but the body as a whole is held to the plan's upload size
+    error = limit_upload_size(g.api_key)
+    if error:
+        return error
+
+    audio_files = [f for f in request.files.getlist('audio') if f.filename]
+    # Everything extracted from the request's archives together is held to the plan's upload size
+    extract_budget = PLAN_MAX_UPLOAD_SIZE[g.api_key.subscription_plan]
+    try:
+        for archive in request.files.getlist('archive'):
+            members = extract_archive(
+                archive, current_app.config['BATCH_MAX_FILES'], current_app.config['BATCH_MAX_MEMBER_SIZE'],
+                extract_budget, request.spool_member
+            )
+            extract_budget -= sum(upload_size(member) for member in members)
+            audio_files.extend(members)
+    except ArchiveError as e:
+        return jsonify({"error": "Invalid archive", "message": str(e)}), 400
+
+    if not audio_files:
+        return jsonify({"error": "No audio file provided"}), 400
+    if len(audio_files) > current_app.config['BATCH_MAX_FILES']:
+        return jsonify({"error": f"At most {current_app.config['BATCH_MAX_FILES']} files per batch"}), 400
 
-    except sr.RequestError as e:
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-        return jsonify({
-            "error": "Service error",
-            "message": f"Could not request results from speech recognition service; {str(e)}"
-        }), 503
+    # Per-file overrides are a JSON object mapping file names (paths inside archives) to languages
+    default_language = request.form.get('language', 'english').lower()
+    try:
+        overrides = json.loads(request.form.get('languages', '{}'))
+    except ValueError:
+        return jsonify({"error": "Invalid languages mapping"}), 400
+    if not isinstance(overrides, dict):
+        return jsonify({"error": "Invalid languages mapping"}), 400
+
+    backend, error = select_backend(request.form.get('backend'))
+    if error:
+        return error
+
+    plan = g.api_key.subscription_plan
+    results = [None] * len(audio_files)
+    accepted = []
+    for index, audio_file in enumerate(audio_files):
+        language = str(overrides.get(audio_file.filename, default_language)).lower()
+        if not allowed_file(audio_file.filename) or audio_format(audio_file) is None:
+            results[index] = {"filename": audio_file.filename, "error": "Invalid file type", "status": 400}
+        elif upload_size(audio_file) > PLAN_MAX_UPLOAD_SIZE[plan]:
+            results[index] = {"filename": audio_file.filename, "error": "File too large", "status": 413}
+        elif language not in SUPPORTED_LANGUAGES:
+            results[index] = {"filename": audio_file.filename, "error": "Unsupported language", "status": 400}
+        else:
+            accepted.append((index, audio_file, language))
+
+    # Every accepted file counts as one request, charged together in one log transaction
+    if accepted:
+        error = charge_request(g.api_key, len(accepted))
+        if error:
+            return error
+
+    bypass_cache = 'no-cache' in request.headers.get('Cache-Control', '')
+    pool = get_batch_pool(current_app.config['BATCH_WORKERS'])
+    app = current_app._get_current_object()
+    futures = [
+        (index, pool.submit(_transcribe_batch_item, app, audio_file, language, backend, bypass_cache, PLAN_MAX_DURATION[plan]))
+        for index, audio_file, language in accepted
+    ]
+    for index, future in futures:
+        results[index] = future.result()
+
+    return jsonify({"results": results, "charged": len(accepted)})
+
+@authenticate_api_key
+def speech_to_text_stream():
+    # The body is raw audio (WAV, or 16-bit PCM as audio/l16), so options come from the query string.
+    # The stream's format is checked before the request is charged
+    from streaming import StreamFormatError, stream_parameters, transcribe_stream, format_event
+
+    error = limit_upload_size(g.api_key)
+    if error:
+        return error
+
+    language = request.args.get('language', 'english').lower()
+    error = validate_language(language)
+    if error:
+        return error
+
+    backend, error = select_backend(request.args.get('backend'))
+    if error:
+        return error
 
+    try:
+        channels, frame_rate, sample_width = stream_parameters(
+            request.stream, request.mimetype, request.mimetype_params
+        )
+    except StreamFormatError as e:
+        return jsonify({"error": "Invalid audio stream", "message": str(e)}), 400
+
+    error = charge_request(g.api_key)
+    if error:
+        return error
+
+    language_code = SUPPORTED_LANGUAGES[language]
+    events = transcribe_stream(
+        request.stream, channels, frame_rate, sample_width, language_code,
+        worker_resources.backend(backend, current_app.config), current_app.config,
+        max_duration=PLAN_MAX_DURATION[g.api_key.subscription_plan]
+    )
+    ndjson = request.accept_mimetypes.best == 'application/x-ndjson'
+    return Response(
+        stream_with_context(format_event(event, ndjson) for event in events),
+        mimetype='application/x-ndjson' if ndjson else 'text/event-stream'
+    )
+
+@require_api_key
+def create_job():
+    from recognition import error_response
+
+    audio_file, language, error = validate_audio_upload()
+    if error:
+        return error
+
+    backend, error = select_backend(request.form.get('backend'))
+    if error:
+        return error
+
+    # Long recordings are refused before they are queued, using the duration from the header
+    fmt = audio_format(audio_file)
+    try:
+        check_duration(probe_duration(audio_file, fmt), PLAN_MAX_DURATION[g.api_key.subscription_plan])
     except Exception as e:
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-        return jsonify({
-            "error": "Processing error",
-            "message": str(e)
-        }), 500
+        body, status = error_response(e)
+        return jsonify(body), status
+
+    job = job_manager.create(
+        audio_file,
+        fmt,
+        language,
+        SUPPORTED_LANGUAGES[language],
+        backend,
+        g.api_key
+    )
+    return jsonify(job_manager.describe(job)), 202
+
+@authenticate_api_key
+def get_job(job_id):
+    job = job_manager.get(job_id, g.api_key.user_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job_manager.describe(job))
+
+@authenticate_api_key
+def cache_stats():
+    return jsonify(transcription_cache.stats())
+
+@authenticate_api_key
+def resource_stats():
+    return jsonify(worker_resources.stats())
+
+def metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        expected = f"Bearer {token}".encode()
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected):
+            return jsonify({"error": "Invalid metrics token"}), 401
+
+    body, content_type = render()
+    return Response(body, content_type=content_type)
+
+def record_response(response):
+    if request.endpoint and request.endpoint != 'metrics':
+        RESPONSES.labels(request.endpoint, response.status_code).inc()
+    timings = g.get('timings')
+    if timings and current_app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = server_timing(timings)
+    return response
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ['wav', 'mp3', 'ogg', 'flac']
 
+# Endpoint names are the view function names, as recorded in the request logs and metrics
+ROUTES = [
+    ('/register', register, ['POST']),
+    ('/generate-api-key', generate_api_key, ['POST']),
+    ('/speech-to-text', speech_to_text, ['POST']),
+    ('/speech-to-text/batch', speech_to_text_batch, ['POST']),
+    ('/speech-to-text/stream', speech_to_text_stream, ['POST']),
+    ('/jobs', create_job, ['POST']),
+    ('/jobs/<job_id>', get_job, ['GET']),
+    ('/cache/stats', cache_stats, ['GET']),
+    ('/resources/stats', resource_stats, ['GET']),
+    ('/metrics', metrics, ['GET'])
+]
+
+def create_app():
+    app = Flask(__name__)
+    app.request_class = AudioUploadRequest
+    CORS(app)
+    app.config.from_object(Config)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    db.init_app(app)
+    read_db.init_app(app)
+    bcrypt.init_app(app)
+    limiter.init_app(app)
+    request_log_writer.init_app(app)
+    job_manager.init_app(app)
+
+    for rule, view, methods in ROUTES:
+        app.add_url_rule(rule, view_func=view, methods=methods)
+    app.register_error_handler(RequestEntityTooLarge, request_entity_too_large)
+    app.after_request(record_response)
+    return app
+
+def preload_audio_modules():
+    # Call before forking workers so they share the imported modules instead of each importing them
+    for name in AUDIO_MODULES:
+        importlib.import_module(name)
+
 if __name__ == '__main__':
-    if not os.path.exists("uploads"):
-        os.makedirs("uploads")
-    
+    app = create_app()
+
+    # Load and warm recognition backends and the decoder before accepting requests
+    worker_resources.init_app(app)
+
+    # Pick up jobs that were queued or interrupted before the last shutdown
+    job_manager.recover()
+
     # Check if SSL certificates exist
     ssl_context = None
     if os.path.exists('cert.pem') and os.path.exists('key.pem'):
@@ -0,0 +1,251 @@
+import hashlib
+import os
+import tempfile
+import threading
+import wave
+from io import BytesIO
+from flask import Request, current_app, g
+from werkzeug.exceptions import RequestEntityTooLarge
+
+class AudioTooLongError(ValueError):
+    pass
+
+class MemoryBudget:
+    # Bytes of request bodies held in memory by all requests of this process
+    def __init__(self):
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, size, limit):
+        with self._lock:
+            if self.used + size > limit:
+                return False
+            self.used += size
+            return True
+
+    def release(self, size):
+        with self._lock:
+            self.used -= size
+
+spool_budget = MemoryBudget()
+
+class BoundedStream:
+    # Counts the bytes written for a request and fails once its upload limit is passed, which
+    # also covers chunked bodies that arrive without a Content-Length
+    def __init__(self, stream, request):
+        self._stream = stream
+        self._request = request
+
+    def write(self, data):
+        self._request._received += len(data)
+        limit = self._request.max_content_length
+        if limit is not None and self._request._received > limit:
+            raise RequestEntityTooLarge()
+        return self._stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    def __iter__(self):
+        return iter(self._stream)
+
+class AudioUploadRequest(Request):
+    _received = 0
+    _reserved = 0
+    _members_reserved = 0
+    _member_files = ()
+
+    @property
+    def max_content_length(self):
+        # The authenticated plan's upload limit, once known, tightens MAX_CONTENT_LENGTH
+        limit = current_app.config['MAX_CONTENT_LENGTH']
+        plan_limit = g.get('max_upload_size')
+        if plan_limit is not None and (limit is None or plan_limit < limit):
+            return plan_limit
+        return limit
+
+    @property
+    def max_form_memory_size(self):
+        return current_app.config['MAX_FORM_MEMORY_SIZE']
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BoundedStream(self._spool(total_content_length, filename), self)
+
+    def _spool(self, total_content_length, filename):
+        # Small bodies stay in memory while the process-wide budget allows it; the whole body
+        # is reserved once, on its first file part
+        max_memory = current_app.config['AUDIO_SPOOL_MAX_MEMORY']
+        if total_content_length is not None and total_content_length <= max_memory:
+            if self._reserved or spool_budget.reserve(total_content_length, current_app.config['AUDIO_SPOOL_MEMORY_BUDGET']):
+                self._reserved = total_content_length
+                return BytesIO()
+
+        # Spill large bodies to a uniquely named file so concurrent uploads never collide;
+        # the file is removed when the request closes its uploaded files
+        suffix = os.path.splitext(filename or '')[1]
+        return tempfile.NamedTemporaryFile(
+            mode='w+b',
+            dir=current_app.config['UPLOAD_FOLDER'],
+            prefix='upload-',
+            suffix=suffix
+        )
+
+    def spool_member(self, size, filename=None):
+        # A buffer for a file extracted from an uploaded archive, kept in memory under the same
+        # per-upload and process-wide limits as request bodies and otherwise written to disk;
+        # it is released when the request closes
+        config = current_app.config
+        if size <= config['AUDIO_SPOOL_MAX_MEMORY'] and spool_budget.reserve(size, config['AUDIO_SPOOL_MEMORY_BUDGET']):
+            self._members_reserved += size
+            buffer = BytesIO()
+        else:
+            buffer = tempfile.NamedTemporaryFile(
+                mode='w+b',
+                dir=config['UPLOAD_FOLDER'],
+                prefix='upload-',
+                suffix=os.path.splitext(filename or '')[1]
+            )
+        self._member_files = self._member_files + (buffer,)
+        return buffer
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            for buffer in self._member_files:
+                buffer.close()
+            self._member_files = ()
+            reserved = self._reserved + self._members_reserved
+            if reserved:
+                spool_budget.release(reserved)
+                self._reserved = self._members_reserved = 0
+
+def audio_format(audio_file):
+    # Detects the container from the first bytes of the upload rather than trusting the
+    # file name; returns None for anything that is not WAV, FLAC, Ogg or MP3
+    stream = audio_file.stream
+    stream.seek(0)
+    header = stream.read(12)
+    stream.seek(0)
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        return 'wav'
+    if header[:4] == b'fLaC':
+        return 'flac'
+    if header[:4] == b'OggS':
+        return 'ogg'
+    # An ID3 tag, or an MPEG audio frame sync
+    if header[:3] == b'ID3' or (len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return 'mp3'
+    return None
+
+def upload_size(audio_file):
+    stream = audio_file.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+def probe_duration(audio_file, fmt):
+    # Duration in seconds without decoding the samples: from the header for WAV, otherwise by ffprobe
+    stream = audio_file.stream
+    stream.flush()
+    stream.seek(0)
+    try:
+        if fmt == 'wav':
+            with wave.open(stream, 'rb') as wav:
+                return wav.getnframes() / wav.getframerate()
+        from pydub.utils import mediainfo_json
+
+        path = getattr(stream, 'name', None)
+        info = mediainfo_json(path if isinstance(path, str) else stream)
+        return float(info.get('format', {}).get('duration') or 0)
+    finally:
+        stream.seek(0)
+
+def check_duration(seconds, max_duration):
+    if max_duration is not None and seconds > max_duration:
+        raise AudioTooLongError(f"Audio is {seconds:.0f} seconds long; your plan allows up to {max_duration} seconds")
+
+def decode_audio(audio_file, fmt):
+    stream = audio_file.stream
+    stream.flush()
+    stream.seek(0)
+
+    # Spooled uploads are handed to ffmpeg by path, in-memory ones are piped through stdin
+    path = getattr(stream, 'name', None)
+    source = path if isinstance(path, str) else stream
+    return load_audio(source, fmt)
+
+def load_audio(source, fmt):
+    # Decoded as recorded; preprocess_audio downmixes and resamples it for the recognizer.
+    # pydub and speech_recognition are imported on first use so the app starts without them
+    from pydub import AudioSegment
+
+    return AudioSegment.from_file(source, format=fmt)
+
+def to_audio_data(sound):
+    # The recognizer expects mono PCM, so skip the WAV round trip and pass the samples directly
+    import speech_recognition as sr
+
+    return sr.AudioData(sound.raw_data, sound.frame_rate, sound.sample_width)
+
+def find_silence_cut(sound, start, end, search_ms, min_silence_ms, silence_thresh):
+    # Middle of the last silence within the final `search_ms` before `end`, or None
+    from pydub.silence import detect_silence
+
+    window_start = max(start, end - search_ms)
+    silences = detect_silence(
+        sound[window_start:end],
+        min_silence_len=min_silence_ms,
+        silence_thresh=silence_thresh,
+        seek_step=10
+    )
+    if not silences:
+        return None
+
+    silence_start, silence_end = silences[-1]
+    cut = window_start + (silence_start + silence_end) // 2
+    return cut if cut > start else None
+
+def segment_bounds(sound, max_ms, overlap_ms, search_ms, min_silence_ms, silence_thresh_db):
+    # Cut points are placed in the middle of the last silence found in the final `search_ms`
+    # of each window; windows without silence are hard-cut and overlap the next segment
+    silence_thresh = sound.dBFS - silence_thresh_db
+    duration = len(sound)
+    bounds = []
+    start = 0
+    while start < duration:
+        end = start + max_ms
+        if end >= duration:
+            bounds.append((start, duration))
+            break
+
+        cut = find_silence_cut(sound, start, end, search_ms, min_silence_ms, silence_thresh)
+        if cut is not None:
+            bounds.append((start, cut))
+            start = cut
+        else:
+            bounds.append((start, end))
+            start = end - overlap_ms
+    return bounds
+
+def content_digest(audio_file, *extra):
+    # Hash of the uploaded bytes plus anything else that changes the transcription
+    digest = hashlib.sha256()
+    stream = audio_file.stream
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(64 * 1024), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    for value in extra:
+        digest.update(b'\0' + str(value).encode())
+    return digest.hexdigest()
+
+def warm_up_decoder():
+    # Runs one tiny encode/decode through ffmpeg so its binary and codecs are loaded before traffic
+    from pydub import AudioSegment
+
+    buffer = BytesIO()
+    AudioSegment.silent(duration=100).export(buffer, format='ogg')
+    buffer.seek(0)
+    load_audio(buffer, 'ogg')
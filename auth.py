@@ -0,0 +1,44 @@
+import secrets
+import string
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+API_KEY_ALPHABET = string.ascii_letters + string.digits
+
+def new_api_key(length=50):
+    return ''.join(secrets.choice(API_KEY_ALPHABET) for _ in range(length))
+
+CachedKey = namedtuple('CachedKey', ['api_key_id', 'user_id', 'user_email', 'subscription_plan'])
+
+class APIKeyCache:
+    # Maps API key strings to CachedKey (or None for unknown keys) with TTL and LRU eviction
+    def __init__(self, ttl=60, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = loader(key)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import requests
+from requests.adapters import HTTPAdapter
+import speech_recognition as sr
+from resilience import RetryableRequestError, CircuitOpenError, CircuitBreaker, backoff_delay
+from metrics import RECOGNITION_RETRIES, RECOGNITION_HEDGES, RECOGNITION_CIRCUIT_OPENS, RECOGNITION_FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+class RecognitionBackend:
+    name = None
+    # Remote backends are wrapped with retries, hedging and a circuit breaker by get_backend
+    remote = False
+
+    def __init__(self, config):
+        self.config = config
+
+    def recognize(self, audio_data, language_code):
+        raise NotImplementedError
+
+    def warm_up(self):
+        pass
+
+# A tiny clip of silence used to exercise conversion paths during warm-up
+WARM_UP_AUDIO = sr.AudioData(b'\0\0' * 1600, 16000, 2)
+
+class GoogleBackend(RecognitionBackend):
+    # Same request as Recognizer.recognize_google, but over a pooled keep-alive session
+    # instead of a new urlopen connection per call
+    name = 'google'
+    remote = True
+    url = "http://www.google.com/speech-api/v2/recognize"
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.key = config.get('GOOGLE_SPEECH_API_KEY')
+        self.timeout = config.get('RECOGNIZER_OPERATION_TIMEOUT')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.get('RECOGNITION_HTTP_POOL_SIZE', 10))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def recognize(self, audio_data, language_code):
+        flac_data = audio_data.get_flac_data(
+            convert_rate=None if audio_data.sample_rate >= 8000 else 8000,  # audio samples must be at least 8 kHz
+            convert_width=2  # audio samples must be 16-bit
+        )
+        try:
+            response = self.session.post(
+                self.url,
+                params={"client": "chromium", "lang": language_code, "key": self.key},
+                data=flac_data,
+                headers={"Content-Type": f"audio/x-flac; rate={audio_data.sample_rate}"},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            # Throttling and server errors are worth retrying, other client errors are not
+            status = e.response.status_code
+            error = RetryableRequestError if status == 429 or status >= 500 else sr.RequestError
+            raise error(f"recognition request failed: {e.response.reason}")
+        except requests.RequestException as e:
+            raise RetryableRequestError(f"recognition connection failed: {e}")
+
+        return parse_google_response(response.text)
+
+    def warm_up(self):
+        # Resolves and pages in the FLAC encoder before the first request needs it
+        WARM_UP_AUDIO.get_flac_data(convert_width=2)
+
+def parse_google_response(response_text):
+    # Ignore any blank blocks
+    actual_result = []
+    for line in response_text.split("\n"):
+        if not line:
+            continue
+        result = json.loads(line)["result"]
+        if len(result) != 0:
+            actual_result = result[0]
+            break
+
+    if not isinstance(actual_result, dict) or len(actual_result.get("alternative", [])) == 0:
+        raise sr.UnknownValueError()
+
+    if any("confidence" in alternative for alternative in actual_result["alternative"]):
+        # Return alternative with highest confidence score
+        best_hypothesis = max(actual_result["alternative"], key=lambda alternative: alternative.get("confidence", 0))
+    else:
+        # When there is no confidence available, choose the first hypothesis
+        best_hypothesis = actual_result["alternative"][0]
+    if "transcript" not in best_hypothesis:
+        raise sr.UnknownValueError()
+    return best_hypothesis["transcript"]
+
+class SphinxBackend(RecognitionBackend):
+    # Offline CMU Sphinx recognition; loaded decoders are pooled per language and reused,
+    # instead of reloading the model on every call like recognize_sphinx
+    name = 'sphinx'
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.data_dir = config.get('SPHINX_DATA_DIR') or os.path.join(
+            os.path.dirname(os.path.realpath(sr.__file__)), 'pocketsphinx-data'
+        )
+        self.warm_up_languages = config.get('SPHINX_WARM_UP_LANGUAGES', ['en-US'])
+        self._decoders = {}
+        self._lock = threading.Lock()
+
+    def recognize(self, audio_data, language_code):
+        # The bundled models expect 16-bit mono 16 kHz audio
+        raw_data = audio_data.get_raw_data(convert_rate=16000, convert_width=2)
+        decoder = self._acquire(language_code)
+        try:
+            decoder.start_utt()
+            decoder.process_raw(raw_data, False, True)
+            decoder.end_utt()
+            hypothesis = decoder.hyp()
+        finally:
+            self._release(language_code, decoder)
+
+        if hypothesis is None or not hypothesis.hypstr:
+            raise sr.UnknownValueError()
+        return hypothesis.hypstr
+
+    def warm_up(self):
+        for language_code in self.warm_up_languages:
+            self._release(language_code, self._acquire(language_code))
+
+    def _acquire(self, language_code):
+        # Decoders are not thread-safe, so each call borrows one and a new one is
+        # loaded only when all pooled decoders for the language are busy
+        with self._lock:
+            pool = self._decoders.setdefault(language_code, queue.LifoQueue())
+        try:
+            return pool.get_nowait()
+        except queue.Empty:
+            return self._load_decoder(language_code)
+
+    def _release(self, language_code, decoder):
+        self._decoders[language_code].put(decoder)
+
+    def _load_decoder(self, language_code):
+        try:
+            from pocketsphinx import pocketsphinx
+        except ImportError:
+            raise sr.RequestError("missing PocketSphinx module: ensure that PocketSphinx is set up correctly.")
+
+        language_directory = os.path.join(self.data_dir, language_code)
+        if not os.path.isdir(language_directory):
+            raise sr.RequestError(f"missing PocketSphinx language data directory: \"{language_directory}\"")
+
+        config = pocketsphinx.Decoder.default_config()
+        config.set_string("-hmm", os.path.join(language_directory, "acoustic-model"))
+        config.set_string("-lm", os.path.join(language_directory, "language-model.lm.bin"))
+        config.set_string("-dict", os.path.join(language_directory, "pronounciation-dictionary.dict"))
+        config.set_string("-logfn", os.devnull)
+        return pocketsphinx.Decoder(config)
+
+class StubBackend(RecognitionBackend):
+    # Deterministic, network-free backend for tests and load testing
+    name = 'stub'
+
+    def recognize(self, audio_data, language_code):
+        latency = self.config.get('STUB_RECOGNIZER_LATENCY', 0)
+        if latency:
+            time.sleep(latency)
+
+        frame_data = audio_data.get_raw_data()
+        if not frame_data.strip(b'\0'):
+            raise sr.UnknownValueError()
+
+        duration = len(frame_data) / (audio_data.sample_rate * audio_data.sample_width)
+        fingerprint = hashlib.sha1(frame_data).hexdigest()[:8]
+        return f"stub {language_code} {duration:.2f}s {fingerprint}"
+
+class ResilientBackend(RecognitionBackend):
+    # Wraps a remote backend: retryable failures are retried with jittered backoff within
+    # RECOGNITION_DEADLINE, slow calls are optionally hedged with a second request, and a circuit
+    # breaker fails fast (or uses RECOGNITION_FALLBACK_BACKEND) while the error rate is high
+    def __init__(self, backend, config):
+        super().__init__(config)
+        self.backend = backend
+        self.name = backend.name
+        self.retries = config.get('RECOGNITION_RETRIES', 2)
+        self.backoff = config.get('RECOGNITION_RETRY_BACKOFF', 0.5)
+        self.deadline = config.get('RECOGNITION_DEADLINE', 60)
+        self.hedge_delay = config.get('RECOGNITION_HEDGE_DELAY', 0)
+        self.fallback = config.get('RECOGNITION_FALLBACK_BACKEND')
+        self.circuit = CircuitBreaker(
+            window=config.get('RECOGNITION_BREAKER_WINDOW', 20),
+            min_calls=config.get('RECOGNITION_BREAKER_MIN_CALLS', 10),
+            error_rate=config.get('RECOGNITION_BREAKER_ERROR_RATE', 0.5),
+            reset_timeout=config.get('RECOGNITION_BREAKER_RESET', 30)
+        )
+        self._hedge_pool = None
+        if self.hedge_delay:
+            self._hedge_pool = ThreadPoolExecutor(
+                max_workers=config.get('RECOGNITION_HTTP_POOL_SIZE', 10), thread_name_prefix=f"{self.name}-hedge"
+            )
+
+    def recognize(self, audio_data, language_code):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if not self.circuit.allow():
+                return self._fallback(audio_data, language_code)
+            try:
+                text = self._attempt(audio_data, language_code, self.deadline - (time.monotonic() - started))
+            except sr.UnknownValueError:
+                # The service answered, it just did not understand the audio
+                self._record(True)
+                raise
+            except sr.RequestError as e:
+                self._record(False)
+                delay = backoff_delay(attempt, self.backoff)
+                if (not isinstance(e, RetryableRequestError) or attempt >= self.retries
+                        or time.monotonic() - started + delay >= self.deadline):
+                    raise
+                RECOGNITION_RETRIES.labels(self.name).inc()
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except Exception:
+                # An unreadable answer or a local failure is not retried, but still has to be
+                # recorded, or a half-open circuit would wait for its trial call forever
+                self._record(False)
+                raise
+            self._record(True)
+            return text
+
+    def warm_up(self):
+        self.backend.warm_up()
+
+    def _attempt(self, audio_data, language_code, remaining):
+        if self._hedge_pool is None:
+            return self.backend.recognize(audio_data, language_code)
+
+        # Start a second identical request when the first has not answered within the hedge
+        # delay and take whichever succeeds first; the slower one finishes in the background
+        futures = {self._hedge_pool.submit(self.backend.recognize, audio_data, language_code)}
+        done, futures = wait(futures, timeout=min(self.hedge_delay, remaining))
+        if not done:
+            RECOGNITION_HEDGES.labels(self.name).inc()
+            futures.add(self._hedge_pool.submit(self.backend.recognize, audio_data, language_code))
+
+        error = None
+        deadline = time.monotonic() + remaining
+        while True:
+            for future in done:
+                try:
+                    return future.result()
+                except sr.UnknownValueError:
+                    raise
+                except Exception as e:
+                    error = e
+            if not futures:
+                raise error
+            done, futures = wait(futures, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise RetryableRequestError("recognition request timed out")
+
+    def _record(self, success):
+        if self.circuit.record(success):
+            RECOGNITION_CIRCUIT_OPENS.labels(self.name).inc()
+            logger.warning(
+                "Too many %s recognition failures; circuit open for %s seconds", self.name, self.circuit.reset_timeout
+            )
+
+    def _fallback(self, audio_data, language_code):
+        if self.fallback and self.fallback != self.name:
+            RECOGNITION_FALLBACKS.labels(self.name).inc()
+            return get_backend(self.fallback, self.config).recognize(audio_data, language_code)
+        raise CircuitOpenError("recognition service is failing; requests are rejected until it recovers")
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (GoogleBackend, SphinxBackend, StubBackend)
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+def get_backend(name, config):
+    # One instance per backend and worker process so loaded models are reused across requests
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown recognition backend: {name}")
+    with _instances_lock:
+        if name not in _instances:
+            backend = BACKENDS[name](config)
+            _instances[name] = ResilientBackend(backend, config) if backend.remote else backend
+        return _instances[name]
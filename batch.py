@@ -0,0 +1,97 @@
+import gzip
+import tarfile
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from werkzeug.datastructures import FileStorage
+
+COPY_CHUNK_SIZE = 64 * 1024
+# Raised while reading a corrupt, truncated or encrypted archive member
+READ_ERRORS = (zipfile.BadZipFile, tarfile.TarError, gzip.BadGzipFile, zlib.error, EOFError, RuntimeError)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+class ArchiveError(ValueError):
+    pass
+
+def get_batch_pool(max_workers):
+    # Separate from the recognition pool: batch items may themselves fan out into
+    # recognition segments, and sharing one pool could leave them waiting on each other
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch')
+    return _pool
+
+def extract_archive(archive_file, max_files, max_member_size, max_total_size, open_member=None):
+    # Returns the archive's regular files as FileStorage objects named by their full path inside
+    # it, so members with the same name in different folders stay apart. Members are written to
+    # buffers from `open_member(size, name)` (in memory by default) and together may not
+    # decompress to more than `max_total_size` bytes
+    open_member = open_member or (lambda size, name: BytesIO())
+    stream = archive_file.stream
+    stream.seek(0)
+    if zipfile.is_zipfile(stream):
+        stream.seek(0)
+        try:
+            with zipfile.ZipFile(stream) as archive:
+                members = (
+                    (info.filename, info.file_size, lambda info=info: archive.open(info))
+                    for info in archive.infolist() if not info.is_dir()
+                )
+                return _extract(members, max_files, max_member_size, max_total_size, open_member)
+        except READ_ERRORS as e:
+            raise ArchiveError(f"Archive could not be read: {e}")
+
+    stream.seek(0)
+    try:
+        archive = tarfile.open(fileobj=stream, mode='r:*')
+    except tarfile.TarError:
+        raise ArchiveError("Archive must be a zip or tar file")
+    try:
+        with archive:
+            members = (
+                (info.name, info.size, lambda info=info: archive.extractfile(info))
+                for info in archive if info.isfile()
+            )
+            return _extract(members, max_files, max_member_size, max_total_size, open_member)
+    except READ_ERRORS as e:
+        raise ArchiveError(f"Archive could not be read: {e}")
+
+def _extract(members, max_files, max_member_size, max_total_size, open_member):
+    files = []
+    total = 0
+    for name, size, open_source in members:
+        _check_limits(name, size, len(files), max_files, max_member_size)
+        if total + size > max_total_size:
+            raise ArchiveError(f"Archive contents are larger than {max_total_size} bytes")
+        buffer = open_member(size, name)
+        with open_source() as source:
+            # Declared sizes are checked up front; the copy stops at them in case they lie
+            copied = _copy(source, buffer, size)
+        if copied > size:
+            raise ArchiveError(f"Archive member {name} is larger than it declares")
+        total += copied
+        buffer.seek(0)
+        files.append(FileStorage(stream=buffer, filename=name))
+    return files
+
+def _copy(source, buffer, limit):
+    copied = 0
+    while copied <= limit:
+        chunk = source.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.write(chunk)
+        copied += len(chunk)
+    return copied
+
+def _check_limits(name, size, count, max_files, max_member_size):
+    if count >= max_files:
+        raise ArchiveError(f"Archive contains more than {max_files} files")
+    if size > max_member_size:
+        raise ArchiveError(f"Archive member {name} is larger than {max_member_size} bytes")
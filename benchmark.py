@@ -0,0 +1,423 @@
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import signal
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import numpy as np
+import requests
+from prometheus_client.parser import text_string_to_metric_families
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+Fixture = namedtuple('Fixture', ['name', 'filename', 'data'])
+
+# Server-side histograms reported next to the client-side latency
+STAGES = ('auth', 'quota', 'log', 'upload', 'decode', 'preprocess', 'recognize')
+
+# Cold-start steps timed in fresh interpreters: (name, setup, statement timed)
+STARTUP_STEPS = (
+    ('import_models', '', 'import models'),
+    ('create_app', '', 'from app import create_app; create_app()'),
+    ('preload_audio', 'from app import preload_audio_modules', 'preload_audio_modules()'),
+)
+
+def synth_speech(seconds, rate=44100, channels=2, seed=0):
+    # Voiced harmonics with a drifting pitch, syllable-rate envelope and a pause every two
+    # seconds, so trimming and silence detection have something to work on
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    f0 = 140 + 40 * np.sin(2 * np.pi * 0.3 * t + seed)
+    phase = 2 * np.pi * np.cumsum(f0) / rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    envelope[(t % 2.0) > 1.7] = 0
+    signal = 0.3 * voice * envelope + rng.normal(0, 0.002, len(t))
+    pcm = (np.clip(signal, -1, 1) * 32767).astype('<i2')
+    return np.repeat(pcm[:, None], channels, axis=1).tobytes()
+
+def build_fixtures(formats, durations):
+    from pydub import AudioSegment
+
+    fixtures = []
+    skipped = set()
+    for seconds in durations:
+        sound = AudioSegment(synth_speech(seconds, seed=len(fixtures)), sample_width=2, frame_rate=44100, channels=2)
+        for fmt in formats:
+            if fmt in skipped:
+                continue
+            buffer = BytesIO()
+            try:
+                sound.export(buffer, format=fmt)
+            except Exception as e:
+                # Everything but WAV needs ffmpeg
+                print(f"Skipping {fmt} fixtures: {e}", file=sys.stderr)
+                skipped.add(fmt)
+                continue
+            fixtures.append(Fixture(f"{fmt}-{seconds:g}s", f"bench-{seconds:g}s.{fmt}", buffer.getvalue()))
+    return fixtures
+
+def create_api_keys(count):
+    # Gold keys in the benchmark database; run after the environment points the config at it
+    from models import create_db_app, db, User, APIKey
+
+    app = create_db_app()
+    keys = []
+    with app.app_context():
+        db.create_all()
+        user = User(email='benchmark@example.com', subscription_plan='gold', jwt_token='benchmark')
+        db.session.add(user)
+        db.session.commit()
+        for _ in range(count):
+            key = ''.join(random.choices(string.ascii_letters + string.digits, k=50))
+            db.session.add(APIKey(key=key, user_id=user.id))
+            keys.append(key)
+        db.session.commit()
+    return keys
+
+def _rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The command name may contain spaces, so the parent pid is read after its closing paren
+                ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+class RSSMonitor(threading.Thread):
+    # Samples the summed resident memory of the server master and its workers (Linux /proc)
+    def __init__(self, pid, interval=0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            pids = [self.pid] + _children(self.pid)
+            self.peak = max(self.peak, sum(_rss_bytes(pid) for pid in pids))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def scrape_histograms(base_url):
+    # {(histogram, stage): {upper bound: cumulative count}} from the server's /metrics
+    histograms = {}
+    text = requests.get(f"{base_url}/metrics", timeout=10).text
+    for family in text_string_to_metric_families(text):
+        if family.type != 'histogram':
+            continue
+        for sample in family.samples:
+            if sample.name.endswith('_bucket'):
+                key = (family.name, sample.labels.get('stage', ''))
+                histograms.setdefault(key, {})[float(sample.labels['le'])] = sample.value
+    return histograms
+
+def histogram_delta(after, before):
+    return {
+        key: {bound: count - before.get(key, {}).get(bound, 0) for bound, count in buckets.items()}
+        for key, buckets in after.items()
+    }
+
+def histogram_quantile(q, buckets):
+    # Linear interpolation within the bucket holding the rank, as Prometheus' histogram_quantile does
+    total = buckets.get(float('inf'), 0)
+    if not total:
+        return None
+    rank = q * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound in sorted(buckets):
+        count = buckets[bound]
+        if count >= rank:
+            if math.isinf(bound):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+def start_server(workdir, args):
+    env = dict(
+        os.environ,
+        DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'benchmark.db')}",
+        UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+        QUOTA_STORAGE_URI=f"sqlite:///{os.path.join(workdir, 'quota.db')}",
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, 'metrics'),
+        RECOGNITION_BACKEND='stub',
+        ALLOWED_RECOGNITION_BACKENDS='stub',
+        STUB_RECOGNIZER_LATENCY=str(args.latency),
+        API_KEY_RATE_LIMITS='1000000 per hour',
+        METRICS_TOKEN='',
+        SERVER_HOST='127.0.0.1',
+        SERVER_PORT=str(args.port),
+        SERVER_WORKERS=str(args.workers),
+        SERVER_THREADS=str(args.threads),
+        SSL_CERTFILE=os.path.join(workdir, 'no-cert.pem'),
+    )
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'serve.py')],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    started = time.monotonic()
+    deadline = started + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited during startup, see {log.name}")
+        try:
+            requests.get(f"{base_url}/metrics", timeout=1)
+            return server, base_url, time.monotonic() - started
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    server.terminate()
+    raise RuntimeError("Server did not start within 60 seconds")
+
+def time_startup_step(setup, statement, env):
+    code = (
+        f"import time\n{setup}\nstarted = time.perf_counter()\n{statement}\n"
+        "print(time.perf_counter() - started)"
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.split()[-1])
+
+def measure_startup(runs):
+    # Median of `runs` cold imports each, so CLI scripts and new workers show their start-up cost
+    env = dict(os.environ, PYTHONWARNINGS='ignore')
+    return {
+        f"{name}_ms": float(np.median([time_startup_step(setup, statement, env) for _ in range(runs)])) * 1000
+        for name, setup, statement in STARTUP_STEPS
+    }
+
+def run_load(base_url, keys, fixtures, concurrency, total, use_cache):
+    local = threading.local()
+    headers = {} if use_cache else {'Cache-Control': 'no-cache'}
+
+    def send(index):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        fixture = fixtures[index % len(fixtures)]
+        started = time.perf_counter()
+        try:
+            response = session.post(
+                f"{base_url}/speech-to-text",
+                headers={**headers, 'X-API-Key': keys[index % len(keys)]},
+                files={'audio': (fixture.filename, fixture.data)},
+                data={'language': 'english'},
+                timeout=300
+            )
+            status = response.status_code
+        except requests.RequestException:
+            status = 'error'
+        return fixture.name, status, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, range(total)))
+    return results, time.perf_counter() - started
+
+def latency_summary(latencies):
+    if not latencies:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {"count": len(latencies), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": max(latencies) * 1000}
+
+def summarize(results, elapsed, histograms, peak_rss, locked_errors):
+    ok = [latency for _, status, latency in results if status == 200]
+    by_fixture = {}
+    for name, status, latency in results:
+        if status == 200:
+            by_fixture.setdefault(name, []).append(latency)
+
+    stages = {}
+    for stage in STAGES:
+        buckets = histograms.get(('transcription_stage_seconds', stage))
+        if buckets and buckets.get(float('inf')):
+            stages[stage] = {
+                f"p{int(q * 100)}_ms": histogram_quantile(q, buckets) * 1000 for q in (0.5, 0.95, 0.99)
+            }
+    flush = histograms.get(('request_log_flush_seconds', ''), {})
+
+    return {
+        "requests": len(results),
+        "elapsed_s": elapsed,
+        "rps": len(ok) / elapsed if elapsed else 0.0,
+        "statuses": {str(status): count for status, count in Counter(status for _, status, _ in results).items()},
+        "latency": latency_summary(ok),
+        "fixtures": {name: latency_summary(latencies) for name, latencies in sorted(by_fixture.items())},
+        "stages": stages,
+        "peak_rss_mb": peak_rss / (1024 * 1024),
+        # SQLite write contention shows up as time waiting for the quota store and log writer locks
+        "db": {
+            "quota_p95_ms": stages.get('quota', {}).get('p95_ms'),
+            "log_flushes": flush.get(float('inf'), 0),
+            "log_flush_p95_ms": (histogram_quantile(0.95, flush) or 0) * 1000 if flush else None,
+            "locked_errors": locked_errors
+        }
+    }
+
+def print_report(report):
+    print(f"Requests: {report['requests']} in {report['elapsed_s']:.1f}s, {report['rps']:.1f} successful requests/sec")
+    print(f"Statuses: {', '.join(f'{status}={count}' for status, count in sorted(report['statuses'].items()))}")
+    latency = report['latency']
+    if latency['count']:
+        print(f"Latency: p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, p99 {latency['p99_ms']:.1f} ms")
+    for name, latency in report['fixtures'].items():
+        print(f"  {name:12} p50 {latency['p50_ms']:8.1f} ms  p95 {latency['p95_ms']:8.1f} ms  ({latency['count']} ok)")
+    print("Server stages:")
+    for stage, quantiles in report['stages'].items():
+        print(f"  {stage:12} p50 {quantiles['p50_ms']:8.1f} ms  p95 {quantiles['p95_ms']:8.1f} ms  p99 {quantiles['p99_ms']:8.1f} ms")
+    print(f"Peak server RSS: {report['peak_rss_mb']:.1f} MB")
+    db = report['db']
+    quota = 'n/a' if db['quota_p95_ms'] is None else f"{db['quota_p95_ms']:.1f} ms"
+    flush = 'n/a' if db['log_flush_p95_ms'] is None else f"{db['log_flush_p95_ms']:.1f} ms"
+    print(f"DB contention: quota p95 {quota}, {db['log_flushes']:.0f} log flushes (p95 {flush}), "
+          f"{db['locked_errors']} 'database is locked' errors")
+
+def print_startup(startup):
+    print("Startup: " + ", ".join(f"{name[:-3]} {ms:.0f} ms" for name, ms in startup.items()))
+
+def startup_regressions(startup, baseline, tolerance):
+    return [
+        f"{name[:-3]} {ms:.0f} ms vs baseline {baseline[name]:.0f} ms"
+        for name, ms in startup.items()
+        if baseline.get(name) and ms > baseline[name] * (1 + tolerance)
+    ]
+
+def regressions(report, baseline, tolerance):
+    # Throughput may not drop, nor p95 latency or peak memory grow, by more than `tolerance`
+    problems = []
+    if report['rps'] < baseline['rps'] * (1 - tolerance):
+        problems.append(f"throughput {report['rps']:.1f} rps vs baseline {baseline['rps']:.1f}")
+    current, previous = report['latency'].get('p95_ms'), baseline['latency'].get('p95_ms')
+    if current is not None and previous and current > previous * (1 + tolerance):
+        problems.append(f"p95 latency {current:.1f} ms vs baseline {previous:.1f} ms")
+    for stage, quantiles in report['stages'].items():
+        previous = baseline['stages'].get(stage, {}).get('p95_ms')
+        # Sub-millisecond stages are dominated by bucket resolution
+        if previous and previous >= 1 and quantiles['p95_ms'] > previous * (1 + tolerance):
+            problems.append(f"{stage} p95 {quantiles['p95_ms']:.1f} ms vs baseline {previous:.1f} ms")
+    if report['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        problems.append(f"peak RSS {report['peak_rss_mb']:.1f} MB vs baseline {baseline['peak_rss_mb']:.1f} MB")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /speech-to-text against a temporary database and the stub recognizer')
+    parser.add_argument('--requests', type=int, default=200, help='Requests to send (default: 200)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients (default: 8)')
+    parser.add_argument('--warmup', type=int, default=10, help='Requests sent before measuring (default: 10)')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub recognizer latency in seconds (default: 0.05)')
+    parser.add_argument('--formats', default='wav,mp3,ogg,flac', help='Fixture formats (default: wav,mp3,ogg,flac)')
+    parser.add_argument('--durations', default='1,5,30', help='Fixture lengths in seconds (default: 1,5,30)')
+    parser.add_argument('--workers', type=int, default=2, help='Server worker processes (default: 2)')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per server worker (default: 4)')
+    parser.add_argument('--port', type=int, default=5099, help='Port for the benchmark server (default: 5099)')
+    parser.add_argument('--cache', action='store_true', help='Allow transcription cache hits')
+    parser.add_argument('--save', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare with results saved by --save and exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed regression against the baseline (default: 0.25)')
+    parser.add_argument('--startup-runs', type=int, default=5, help='Cold starts timed per startup step (default: 5)')
+    parser.add_argument('--startup-only', action='store_true', help='Only time imports and app creation, without a load test')
+    parser.add_argument('--keep', action='store_true', help='Keep the temporary directory with the database and server log')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='vocaltranscribe-bench-')
+    # The benchmark database is set up in this process, so point the config at it before importing the app
+    os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.environ['QUOTA_STORAGE_URI'] = 'memory://'
+
+    try:
+        startup = measure_startup(args.startup_runs)
+        if args.startup_only:
+            report = {"startup": startup}
+            print_startup(startup)
+        else:
+            report = run_benchmark(workdir, args, startup)
+
+        if args.save:
+            with open(args.save, 'w') as output:
+                json.dump(report, output, indent=2)
+        if args.baseline:
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+            problems = startup_regressions(startup, baseline.get('startup', {}), args.tolerance)
+            if 'rps' in report and 'rps' in baseline:
+                problems += regressions(report, baseline, args.tolerance)
+            for problem in problems:
+                print(f"Regression: {problem}")
+            if problems:
+                sys.exit(1)
+    finally:
+        if args.keep:
+            print(f"Benchmark files kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def run_benchmark(workdir, args, startup):
+    fixtures = build_fixtures(args.formats.split(','), [float(d) for d in args.durations.split(',')])
+    if not fixtures:
+        sys.exit("No fixtures could be generated")
+
+    # Gold keys allow 2000 requests a month, so spread the load over enough of them
+    keys = create_api_keys(max(args.concurrency, math.ceil((args.requests + args.warmup) / 1500)))
+    server, base_url, ready_seconds = start_server(workdir, args)
+    try:
+        monitor = RSSMonitor(server.pid)
+        monitor.start()
+
+        run_load(base_url, keys, fixtures, args.concurrency, args.warmup, args.cache)
+        before = scrape_histograms(base_url)
+        results, elapsed = run_load(base_url, keys, fixtures, args.concurrency, args.requests, args.cache)
+        histograms = histogram_delta(scrape_histograms(base_url), before)
+        monitor.stop()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    with open(os.path.join(workdir, 'server.log')) as log:
+        locked_errors = log.read().count('database is locked')
+    # Time from launching serve.py until it answers, with the audio modules preloaded and backends warmed
+    startup['server_ready_ms'] = ready_seconds * 1000
+    report = summarize(results, elapsed, histograms, monitor.peak, locked_errors)
+    report['startup'] = startup
+    print_report(report)
+    print_startup(startup)
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import json
+import threading
+from collections import OrderedDict
+from sqlalchemy.exc import IntegrityError
+from models import db, CachedTranscription
+
+class TranscriptionCache:
+    # LRU of transcription results keyed by content digest, optionally backed by the database
+    def __init__(self, maxsize=1024, persist=False):
+        self.maxsize = maxsize
+        self.persist = persist
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            result = self._entries.get(digest)
+            if result is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return result
+
+        if self.persist:
+            row = db.session.get(CachedTranscription, digest)
+            if row is not None:
+                result = json.loads(row.result)
+                self._remember(digest, result)
+                with self._lock:
+                    self.hits += 1
+                return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, digest, result):
+        self._remember(digest, result)
+        if self.persist:
+            try:
+                db.session.merge(CachedTranscription(digest=digest, result=json.dumps(result)))
+                db.session.commit()
+            except IntegrityError:
+                # Another worker stored the same digest first
+                db.session.rollback()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, digest, result):
+        with self._lock:
+            self._entries[digest] = result
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
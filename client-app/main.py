@@ -1,20 +1,79 @@
 import os
+import csv
+import json
+import time
 import requests
+from requests.adapters import HTTPAdapter
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import urllib3
+from urllib3.util.retry import Retry
 
 # Suppress only the single InsecureRequestWarning
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.flac')
+MAX_PARALLEL_UPLOADS = 16
+# Rate-limited uploads are retried this many times, when the server asks to wait at most MAX_RETRY_WAIT seconds
+MAX_RETRIES = 3
+MAX_RETRY_WAIT = 30
+# Seconds to connect, and to wait for the transcription once the file is sent
+REQUEST_TIMEOUT = (10, 300)
+
+def create_session(pool_size=MAX_PARALLEL_UPLOADS):
+    """Create a keep-alive session that retries connections that could not be established"""
+    # Answered uploads are never re-sent here: the server has already charged them, and
+    # rate-limited ones are retried by transcribe_file so the wait shows in the file list
+    retry = Retry(
+        total=3,
+        connect=3,
+        read=0,
+        status=0,
+        backoff_factor=1,  # 1s, 2s, 4s
+        allowed_methods=frozenset(['POST']),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def retry_wait(response):
+    """Return the seconds to wait before retrying a rate-limited upload, or None if it cannot succeed by retrying"""
+    if response.status_code != 429:
+        return None
+    # Only the per-key rate limits send Retry-After; the monthly quota does not reset by waiting
+    try:
+        return max(0.0, float(response.headers['Retry-After']))
+    except (KeyError, ValueError):
+        return None
+
+def find_audio_files(path):
+    """Return the audio files in a folder and its subfolders, or the path itself for a file"""
+    if not os.path.isdir(path):
+        return [path]
+    found = []
+    for folder, _, filenames in os.walk(path):
+        for filename in sorted(filenames):
+            if filename.lower().endswith(AUDIO_EXTENSIONS):
+                found.append(os.path.join(folder, filename))
+    return sorted(found)
+
 class SpeechTranscriptionApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Speech Transcription")
-        self.root.geometry("800x600")
+        self.root.geometry("900x750")
       
         self.verify_ssl = tk.BooleanVar(value=True)
+
+        # One session for all uploads so connections are kept alive and reused
+        self.session = create_session()
+        self.file_paths = []
+        self.results = []
   
         self.show_password = tk.BooleanVar(value=False)
         
@@ -83,15 +142,16 @@ class SpeechTranscriptionApp:
         )
         self.ssl_verify_cb.grid(row=2, column=0, columnspan=3, sticky=tk.W, pady=5)
         
-        # File selection
-        ttk.Label(main_frame, text="Audio File:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        # File selection: one or more files, or a folder
+        ttk.Label(main_frame, text="Audio File(s):").grid(row=3, column=0, sticky=tk.W, pady=5)
         self.file_path_var = tk.StringVar()
         ttk.Entry(main_frame, textvariable=self.file_path_var, width=50).grid(
             row=3, column=1, sticky=(tk.W, tk.E), pady=5
         )
-        ttk.Button(main_frame, text="Browse", command=self.browse_file).grid(
-            row=3, column=2, sticky=tk.W, pady=5, padx=5
-        )
+        browse_frame = ttk.Frame(main_frame)
+        browse_frame.grid(row=3, column=2, sticky=tk.W, pady=5, padx=5)
+        ttk.Button(browse_frame, text="Browse", command=self.browse_file).grid(row=0, column=0)
+        ttk.Button(browse_frame, text="Folder", command=self.browse_folder).grid(row=0, column=1, padx=(5, 0))
         
         # Language selection dropdown
         ttk.Label(main_frame, text="Select Language:").grid(row=4, column=0, sticky=tk.W, pady=5)
@@ -104,16 +164,46 @@ class SpeechTranscriptionApp:
             width=47
         )
         language_dropdown.grid(row=4, column=1, sticky=(tk.W, tk.E), pady=5)
+
+        # Number of files uploaded at the same time
+        ttk.Label(main_frame, text="Parallel Uploads:").grid(row=5, column=0, sticky=tk.W, pady=5)
+        self.parallel_uploads = tk.IntVar(value=4)
+        ttk.Spinbox(
+            main_frame,
+            from_=1,
+            to=MAX_PARALLEL_UPLOADS,
+            textvariable=self.parallel_uploads,
+            state="readonly",
+            width=5
+        ).grid(row=5, column=1, sticky=tk.W, pady=5)
+
+        # Per-file progress
+        file_frame = ttk.Frame(main_frame)
+        file_frame.grid(row=6, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
+        file_frame.columnconfigure(0, weight=1)
+
+        self.file_list = ttk.Treeview(file_frame, columns=("status", "time"), height=8)
+        self.file_list.heading("#0", text="File")
+        self.file_list.heading("status", text="Status")
+        self.file_list.heading("time", text="Time")
+        self.file_list.column("#0", width=480)
+        self.file_list.column("status", width=220)
+        self.file_list.column("time", width=80, anchor=tk.E)
+        self.file_list.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+        file_scrollbar = ttk.Scrollbar(file_frame, orient=tk.VERTICAL, command=self.file_list.yview)
+        file_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.file_list['yscrollcommand'] = file_scrollbar.set
         
         # Transcription result
-        ttk.Label(main_frame, text="Transcription:").grid(row=5, column=0, sticky=tk.W, pady=5)
+        ttk.Label(main_frame, text="Transcription:").grid(row=7, column=0, sticky=tk.W, pady=5)
         
         # Create a frame for the text widget and scrollbar
         text_frame = ttk.Frame(main_frame)
-        text_frame.grid(row=6, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S))
+        text_frame.grid(row=8, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S))
         text_frame.columnconfigure(0, weight=1)
         
-        self.result_text = tk.Text(text_frame, height=15, width=60, wrap=tk.WORD)
+        self.result_text = tk.Text(text_frame, height=12, width=60, wrap=tk.WORD)
         self.result_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         scrollbar = ttk.Scrollbar(text_frame, orient=tk.VERTICAL, command=self.result_text.yview)
@@ -123,14 +213,20 @@ class SpeechTranscriptionApp:
         # Progress indicator
         self.progress_var = tk.StringVar(value="")
         ttk.Label(main_frame, textvariable=self.progress_var).grid(
-            row=7, column=0, columnspan=3, sticky=tk.W, pady=5
+            row=9, column=0, columnspan=3, sticky=tk.W, pady=5
         )
         
-        # Transcribe button
+        # Transcribe and export buttons
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=10, column=0, columnspan=3, pady=10)
         self.transcribe_button = ttk.Button(
-            main_frame, text="Transcribe", command=self.start_transcription
+            button_frame, text="Transcribe", command=self.start_transcription
+        )
+        self.transcribe_button.grid(row=0, column=0, padx=5)
+        self.export_button = ttk.Button(
+            button_frame, text="Export Results", command=self.export_results, state='disabled'
         )
-        self.transcribe_button.grid(row=8, column=0, columnspan=3, pady=10)
+        self.export_button.grid(row=0, column=1, padx=5)
         
         # Configure grid weights
         main_frame.columnconfigure(1, weight=1)
@@ -148,71 +244,200 @@ class SpeechTranscriptionApp:
             ('Audio files', '*.wav *.mp3 *.ogg *.flac'),
             ('All files', '*.*')
         )
-        filename = filedialog.askopenfilename(filetypes=filetypes)
-        if filename:
-            self.file_path_var.set(filename)
+        filenames = filedialog.askopenfilenames(filetypes=filetypes)
+        if filenames:
+            self.set_files(list(filenames))
+
+    def browse_folder(self):
+        """Select every audio file in a folder"""
+        folder = filedialog.askdirectory()
+        if folder:
+            self.file_path_var.set(folder)
+            self.file_paths = []
+
+    def set_files(self, paths):
+        """Remember the selected files and show them in the entry"""
+        self.file_paths = paths
+        self.file_path_var.set(paths[0] if len(paths) == 1 else f"{len(paths)} files selected")
+
+    def selected_files(self):
+        """Return the files to transcribe from the dialogs or the path typed in the entry"""
+        entry = self.file_path_var.get().strip()
+        if self.file_paths and entry in (self.file_paths[0], f"{len(self.file_paths)} files selected"):
+            return self.file_paths
+        return find_audio_files(entry) if entry else []
+
+    def update_file(self, path, status, seconds=None):
+        """Update a file's row in the progress list; safe to call from worker threads"""
+        def update():
+            self.file_list.set(path, "status", status)
+            if seconds is not None:
+                self.file_list.set(path, "time", f"{seconds:.1f}s")
+        self.root.after(0, update)
+
+    def set_progress(self, message):
+        """Update the progress line; safe to call from worker threads"""
+        self.root.after(0, self.progress_var.set, message)
+
+    def transcribe_file(self, path, url, api_key, language_code, verify):
+        """Upload one file through the shared session and return its result"""
+        self.update_file(path, "Uploading...")
+        started = time.perf_counter()
+        result = {"file": path, "bytes": os.path.getsize(path)}
+        wait = None
+        failure = "connection error"
+        try:
+            for attempt in range(MAX_RETRIES + 1):
+                with open(path, 'rb') as audio_file:
+                    response = self.session.post(
+                        url,
+                        files={'audio': (os.path.basename(path), audio_file)},
+                        data={'language': language_code},
+                        headers={'X-API-Key': api_key},
+                        verify=verify,
+                        timeout=REQUEST_TIMEOUT
+                    )
+                wait = retry_wait(response)
+                if wait is None or wait > MAX_RETRY_WAIT or attempt == MAX_RETRIES:
+                    break
+                self.update_file(path, f"Rate limited, retrying in {wait:.0f}s")
+                time.sleep(wait)
+                self.update_file(path, "Uploading...")
+
+            result["status"] = response.status_code
+            if response.status_code == 200:
+                result["text"] = response.json()['text']
+            else:
+                result["error"] = response.text
+        except requests.Timeout as e:
+            result["status"] = None
+            result["error"] = str(e)
+            failure = "timed out"
+        except Exception as e:
+            result["status"] = None
+            result["error"] = str(e)
+
+        result["seconds"] = time.perf_counter() - started
+        if result["status"] == 200:
+            status = "Done"
+        elif result["status"] == 429 and wait is not None:
+            status = f"Rate limited, try again in {wait:.0f}s"
+        else:
+            status = f"Failed ({result['status'] or failure})"
+        self.update_file(path, status, result["seconds"])
+        return result
             
     def transcribe_audio(self):
         """Handle the transcription process"""
         try:
-            self.progress_var.set("Preparing transcription...")
-            audio_path = self.file_path_var.get()
+            self.set_progress("Preparing transcription...")
+            audio_paths = self.selected_files()
             
-            if not audio_path:
-                messagebox.showerror("Error", "Please select an audio file")
+            if not audio_paths:
+                self.root.after(0, messagebox.showerror, "Error", "Please select an audio file or a folder with audio files")
                 return
                 
             # Clean and validate API key
             api_key = self.api_key_var.get().strip()
             if not api_key:
-                messagebox.showerror("Error", "Please enter your API key")
+                self.root.after(0, messagebox.showerror, "Error", "Please enter your API key")
                 return
             
             # Get selected language
             selected_language = self.selected_language.get()
             language_code = self.language_mapping[selected_language]
+            url = self.api_url_var.get().strip()  # Clean URL
+            verify = self.verify_ssl.get()
+
+            def reset_list():
+                self.file_list.delete(*self.file_list.get_children())
+                for path in audio_paths:
+                    self.file_list.insert("", tk.END, iid=path, text=path, values=("Queued", ""))
+            self.root.after(0, reset_list)
             
-            # Prepare API request
-            self.progress_var.set(f"Transcribing in {selected_language}...")
-            
-            # Ensure file is properly opened and closed
-            with open(audio_path, 'rb') as audio_file:
-                files = {'audio': audio_file}
-                data = {'language': language_code}
-                headers = {
-                    'X-API-Key': api_key.strip()  # Remove any whitespace
-                }
-                
-                # Make API request with SSL verification setting
-                response = requests.post(
-                    self.api_url_var.get().strip(),  # Clean URL
-                    files=files,
-                    data=data,
-                    headers=headers,
-                    verify=self.verify_ssl.get()
-                )
-            
-            if response.status_code == 200:
-                result = response.json()
+            # Upload through a bounded pool and report progress as files finish
+            self.set_progress(f"Transcribing {len(audio_paths)} file(s) in {selected_language}...")
+            started = time.perf_counter()
+            results = []
+            uploaded = 0
+            with ThreadPoolExecutor(max_workers=self.parallel_uploads.get()) as pool:
+                futures = [
+                    pool.submit(self.transcribe_file, path, url, api_key, language_code, verify)
+                    for path in audio_paths
+                ]
+                for future in as_completed(futures):
+                    result = future.result()
+                    results.append(result)
+                    uploaded += result["bytes"]
+                    elapsed = time.perf_counter() - started
+                    self.set_progress(
+                        f"{len(results)}/{len(audio_paths)} files, "
+                        f"{len(results) / elapsed:.2f} files/s, {uploaded / elapsed / 1024 / 1024:.2f} MB/s"
+                    )
+
+            # Keep results in the order of the selection
+            order = {path: index for index, path in enumerate(audio_paths)}
+            self.results = sorted(results, key=lambda result: order[result["file"]])
+            failed = sum(1 for result in self.results if result["status"] != 200)
+            elapsed = time.perf_counter() - started
+
+            def show_results():
                 self.result_text.delete('1.0', tk.END)
-                self.result_text.insert('1.0', result['text'])
-                self.progress_var.set("Transcription complete!")
+                if len(self.results) == 1:
+                    result = self.results[0]
+                    self.result_text.insert('1.0', result["text"] if result["status"] == 200 else f"API Error: {result['status']} - {result['error']}")
+                else:
+                    for result in self.results:
+                        body = result["text"] if result["status"] == 200 else f"Error: {result['status']} - {result['error']}"
+                        self.result_text.insert(tk.END, f"== {os.path.basename(result['file'])} ==\n{body}\n\n")
+                self.export_button['state'] = 'normal'
+            self.root.after(0, show_results)
+
+            if failed:
+                self.set_progress(f"Finished with {failed} of {len(self.results)} file(s) failed in {elapsed:.1f}s")
             else:
-                error_msg = f"API Error: {response.status_code} - {response.text}"
-                self.result_text.delete('1.0', tk.END)
-                self.result_text.insert('1.0', error_msg)
-                self.progress_var.set("Transcription failed!")
+                self.set_progress(f"Transcription complete! {len(self.results)} file(s) in {elapsed:.1f}s ({len(self.results) / elapsed:.2f} files/s)")
                 
         except Exception as e:
-            self.progress_var.set("Error during transcription!")
-            messagebox.showerror("Error", str(e))
+            self.set_progress("Error during transcription!")
+            self.root.after(0, messagebox.showerror, "Error", str(e))
         
         finally:
-            self.transcribe_button['state'] = 'normal'
+            self.root.after(0, lambda: self.transcribe_button.configure(state='normal'))
+
+    def export_results(self):
+        """Save all results of the last run as JSON, CSV or plain text"""
+        if not self.results:
+            return
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=(('JSON', '*.json'), ('CSV', '*.csv'), ('Text', '*.txt'))
+        )
+        if not filename:
+            return
+
+        fields = ["file", "status", "text", "error", "seconds", "bytes"]
+        try:
+            with open(filename, 'w', encoding='utf-8', newline='') as output:
+                if filename.lower().endswith('.csv'):
+                    writer = csv.DictWriter(output, fieldnames=fields)
+                    writer.writeheader()
+                    for result in self.results:
+                        writer.writerow({field: result.get(field, "") for field in fields})
+                elif filename.lower().endswith('.txt'):
+                    for result in self.results:
+                        body = result.get("text") or f"Error: {result['status']} - {result.get('error')}"
+                        output.write(f"{result['file']}\n{body}\n\n")
+                else:
+                    json.dump(self.results, output, indent=2, ensure_ascii=False)
+            self.progress_var.set(f"Exported {len(self.results)} result(s) to {filename}")
+        except OSError as e:
+            messagebox.showerror("Error", str(e))
             
     def start_transcription(self):
         """Start transcription in a separate thread"""
         self.transcribe_button['state'] = 'disabled'
+        self.export_button['state'] = 'disabled'
         self.result_text.delete('1.0', tk.END)
         threading.Thread(target=self.transcribe_audio, daemon=True).start()
 
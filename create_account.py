@@ -1,8 +1,19 @@
 import sys
+import csv
+import json
 import argparse
-from app import app, db, User
+from datetime import datetime
+from itertools import islice
+from models import create_db_app, db, User, APIKey
+from plans import SUBSCRIPTION_LIMITS
+from auth import new_api_key
+from usage import usage_report
 import jwt
 
+COMMANDS = ('create', 'import', 'report')
+
+app = create_db_app()
+
 def create_account(email, subscription_plan):
     with app.app_context():
         if User.query.filter_by(email=email).first():
@@ -26,11 +37,198 @@ def create_account(email, subscription_plan):
         print(f"JWT Token: {jwt_token}")
         return True
 
+def read_accounts(path, fmt):
+    # Rows with `email` and optional `plan` (or `subscription_plan`) and `keys`, read lazily
+    source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+    try:
+        if fmt == 'jsonl':
+            for line in source:
+                if line.strip():
+                    # Lines that are not valid JSON are passed on as None and skipped by the import
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield None
+        else:
+            yield from csv.DictReader(source)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+def parse_account(row, default_plan, keys_per_user):
+    # Returns the email, plan and number of keys of an input row, or raises ValueError with the
+    # reason the row cannot be imported
+    if not isinstance(row, dict):
+        raise ValueError("not a JSON object")
+    email = row.get('email')
+    if not isinstance(email, str) or not email.strip():
+        raise ValueError("missing email")
+    plan = row.get('plan') or row.get('subscription_plan') or default_plan
+    if not isinstance(plan, str) or plan.strip() not in SUBSCRIPTION_LIMITS:
+        raise ValueError(f"unknown plan {plan!r}")
+    keys = row.get('keys')
+    if keys is None or keys == '':
+        keys = keys_per_user
+    try:
+        # str() first so that 2.5 and true are rejected rather than truncated to 2 and 1
+        keys = int(str(keys).strip())
+    except ValueError:
+        raise ValueError(f"invalid number of keys {keys!r}")
+    if keys < 0:
+        raise ValueError(f"invalid number of keys {keys!r}")
+    return email.strip(), plan.strip(), keys
+
+def import_accounts(rows, default_plan, keys_per_user, batch_size, output):
+    # Creates users and their API keys with one multi-row INSERT per table and one transaction
+    # per batch; invalid rows and emails that already exist or repeat in the input are skipped
+    writer = csv.writer(output)
+    writer.writerow(['email', 'subscription_plan', 'jwt_token', 'api_key'])
+    seen = set()
+    created = skipped = 0
+    rows = enumerate(rows, 1)
+
+    with app.app_context():
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            accounts = []
+            for number, row in batch:
+                try:
+                    email, plan, keys = parse_account(row, default_plan, keys_per_user)
+                except ValueError as e:
+                    print(f"Skipping row {number}: {e}", file=sys.stderr)
+                    skipped += 1
+                    continue
+                if email in seen:
+                    print(f"Skipping {email}: duplicate email", file=sys.stderr)
+                    skipped += 1
+                    continue
+                seen.add(email)
+                accounts.append((email, plan, keys))
+
+            emails = [email for email, _, _ in accounts]
+            existing = {email for email, in db.session.query(User.email).filter(User.email.in_(emails))}
+            for email in existing:
+                print(f"Skipping {email}: already registered", file=sys.stderr)
+            skipped += len(existing)
+            accounts = [account for account in accounts if account[0] not in existing]
+            if not accounts:
+                continue
+
+            tokens = {
+                email: jwt.encode({'email': email}, app.config['JWT_SECRET_KEY'], algorithm='HS256')
+                for email, _, _ in accounts
+            }
+            db.session.execute(User.__table__.insert(), [
+                {'email': email, 'subscription_plan': plan, 'jwt_token': tokens[email]}
+                for email, plan, _ in accounts
+            ])
+            user_ids = dict(db.session.query(User.email, User.id).filter(User.email.in_(tokens)))
+
+            now = datetime.utcnow()
+            api_keys = [
+                (email, plan, new_api_key())
+                for email, plan, keys in accounts
+                for _ in range(keys)
+            ]
+            if api_keys:
+                db.session.execute(APIKey.__table__.insert(), [
+                    {'key': key, 'user_id': user_ids[email], 'created_at': now}
+                    for email, _, key in api_keys
+                ])
+            db.session.commit()
+
+            with_keys = {email for email, _, _ in api_keys}
+            writer.writerows([email, plan, tokens[email], key] for email, plan, key in api_keys)
+            writer.writerows(
+                [email, plan, tokens[email], ''] for email, plan, _ in accounts if email not in with_keys
+            )
+            created += len(accounts)
+            print(f"Created {created} accounts", file=sys.stderr)
+
+    return created, skipped
+
+def parse_month(value):
+    return datetime.strptime(value, '%Y-%m').date()
+
+def write_report(by, start, end, from_logs, fmt, output):
+    with app.app_context():
+        columns, rows = usage_report(by, start, end, from_logs)
+        if fmt == 'csv':
+            writer = csv.writer(output)
+            writer.writerow(columns)
+        count = 0
+        for row in rows:
+            values = dict(zip(columns, row))
+            values['month'] = str(values['month'])[:7]
+            if fmt == 'csv':
+                writer.writerow(values[column] for column in columns)
+            else:
+                output.write(json.dumps(values) + '\n')
+            count += 1
+        return count
+
+def open_output(path):
+    return sys.stdout if path in (None, '-') else open(path, 'w', newline='', encoding='utf-8')
+
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Create a new user account')
-    parser.add_argument('email', help='User email address')
-    parser.add_argument('--plan', choices=['free', 'silver', 'gold'], default='free',
+    # `create_account.py user@example.com` keeps working as the short form of `create`
+    if len(sys.argv) > 1 and sys.argv[1] not in COMMANDS and not sys.argv[1].startswith('-'):
+        sys.argv.insert(1, 'create')
+
+    parser = argparse.ArgumentParser(description='Create user accounts and report their usage')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    create_parser = commands.add_parser('create', help='Create a new user account')
+    create_parser.add_argument('email', help='User email address')
+    create_parser.add_argument('--plan', choices=list(SUBSCRIPTION_LIMITS), default='free',
                       help='Subscription plan (default: free)')
-    
+
+    import_parser = commands.add_parser('import', help='Create accounts and API keys in bulk from CSV or JSONL')
+    import_parser.add_argument('file', help="CSV or JSONL file with an email column and optional plan and keys columns ('-' for stdin)")
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'],
+                      help='Input format (default: from the file extension, else csv)')
+    import_parser.add_argument('--plan', choices=list(SUBSCRIPTION_LIMITS), default='free',
+                      help='Plan for rows without one (default: free)')
+    import_parser.add_argument('--keys', type=int, default=1,
+                      help='API keys per account for rows without a keys column (default: 1)')
+    import_parser.add_argument('--batch-size', type=int, default=500,
+                      help='Accounts per transaction (default: 500)')
+    import_parser.add_argument('--output', help='CSV file for the created tokens and API keys (default: stdout)')
+
+    report_parser = commands.add_parser('report', help='Export monthly usage per user or per API key')
+    report_parser.add_argument('--by', choices=['user', 'key'], default='user',
+                      help='Aggregate per user, or per API key and endpoint (default: user)')
+    report_parser.add_argument('--from', dest='start', type=parse_month, help='First month, as YYYY-MM')
+    report_parser.add_argument('--to', dest='end', type=parse_month, help='Last month, as YYYY-MM')
+    report_parser.add_argument('--from-logs', action='store_true',
+                      help='Count the request logs instead of reading the usage rollup')
+    report_parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv',
+                      help='Output format (default: csv)')
+    report_parser.add_argument('--output', help='Output file (default: stdout)')
+
     args = parser.parse_args()
-    create_account(args.email, args.plan)
\ No newline at end of file
+
+    if args.command == 'create':
+        create_account(args.email, args.plan)
+    elif args.command == 'import':
+        fmt = args.format or ('jsonl' if args.file.endswith(('.jsonl', '.ndjson')) else 'csv')
+        output = open_output(args.output)
+        try:
+            created, skipped = import_accounts(
+                read_accounts(args.file, fmt), args.plan, args.keys, args.batch_size, output
+            )
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        print(f"Imported {created} accounts, skipped {skipped}", file=sys.stderr)
+    else:
+        output = open_output(args.output)
+        try:
+            count = write_report(args.by, args.start, args.end, args.from_logs, args.format, output)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        print(f"Exported {count} rows", file=sys.stderr)
@@ -1,8 +1,26 @@
 import os
 import sys
-from app import app, db
-from models import User, APIKey, RequestLog
+import argparse
+from models import create_db_app, db, User, APIKey, RequestLog, UsageRollup
+from usage import backfill_usage_rollups
 
-with app.app_context():
-    db.create_all()
-    print("Database created successfully.")
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create the database schema')
+    parser.add_argument('--backfill', action='store_true',
+                      help='Rebuild the usage rollup table from existing request logs')
+
+    args = parser.parse_args()
+
+    app = create_db_app()
+    with app.app_context():
+        db.create_all()
+
+        # create_all skips tables that already exist, so add indexes introduced since
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=db.engine, checkfirst=True)
+        print("Database created successfully.")
+
+        if args.backfill or not UsageRollup.query.first():
+            rollups = backfill_usage_rollups()
+            print(f"Usage rollup backfilled with {rollups} rows.")
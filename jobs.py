@@ -0,0 +1,181 @@
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from models import db, TranscriptionJob, User
+from plans import PLAN_MAX_DURATION
+from metrics import JOB_WAIT_SECONDS, JOBS
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# Set before a process pool forks so workers reuse the parent's app object
+_worker_app = None
+
+class JobManager:
+    # Persists transcription jobs in the database and runs them on a worker pool
+    def __init__(self, app=None, workers=2, worker_type='thread'):
+        if worker_type not in ('thread', 'process', 'inline'):
+            raise ValueError(f"Unknown job worker type: {worker_type}")
+        self.app = None
+        self.workers = workers
+        self.worker_type = worker_type
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+    def create(self, audio_file, fmt, language, language_code, backend, api_key):
+        job_id = uuid.uuid4().hex
+        job_folder = os.path.join(self.app.config['UPLOAD_FOLDER'], 'jobs')
+        os.makedirs(job_folder, exist_ok=True)
+
+        # The upload is kept on disk so queued jobs survive a restart
+        audio_path = os.path.join(job_folder, f"{job_id}.{fmt}")
+        audio_file.save(audio_path)
+
+        job = TranscriptionJob(
+            id=job_id,
+            api_key_id=api_key.api_key_id,
+            user_id=api_key.user_id,
+            status=JOB_QUEUED,
+            language=language,
+            language_code=language_code,
+            audio_format=fmt,
+            backend=backend,
+            audio_path=audio_path
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        self.submit(job_id)
+        return job
+
+    def get(self, job_id, user_id):
+        return TranscriptionJob.query.filter_by(id=job_id, user_id=user_id).first()
+
+    def describe(self, job):
+        description = {
+            "id": job.id,
+            "status": job.status,
+            "language": job.language,
+            "language_code": job.language_code,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None
+        }
+        if job.status == JOB_DONE:
+            description["result"] = json.loads(job.result)
+        elif job.status == JOB_FAILED:
+            description.update(json.loads(job.error))
+            description["status_code"] = job.error_status
+        return description
+
+    def submit(self, job_id):
+        if self.worker_type == 'inline':
+            run_job(self.app, job_id)
+            return
+        self._get_executor().submit(_run_job_in_worker, job_id)
+
+    def recover(self):
+        self.requeue_interrupted()
+        return self.resume()
+
+    def requeue_interrupted(self):
+        # Jobs left running by a crash are re-queued; only call this from a single process
+        # while no workers are running jobs
+        with self.app.app_context():
+            TranscriptionJob.query.filter_by(status=JOB_RUNNING).update(
+                {TranscriptionJob.status: JOB_QUEUED, TranscriptionJob.started_at: None},
+                synchronize_session=False
+            )
+            db.session.commit()
+
+    def resume(self):
+        # Safe to call from every worker process: each job is claimed by exactly one of them
+        with self.app.app_context():
+            job_ids = [job_id for job_id, in db.session.query(TranscriptionJob.id).filter_by(status=JOB_QUEUED)]
+
+        for job_id in job_ids:
+            self.submit(job_id)
+        return len(job_ids)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+    def _get_executor(self):
+        global _worker_app
+        with self._lock:
+            if self._executor is None:
+                _worker_app = self.app
+                if self.worker_type == 'process':
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('fork'),
+                        initializer=_init_process_worker
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+            return self._executor
+
+def _init_process_worker():
+    # Connections inherited through fork must not be shared with the parent
+    with _worker_app.app_context():
+        db.engine.dispose()
+
+def _run_job_in_worker(job_id):
+    run_job(_worker_app, job_id)
+
+def run_job(app, job_id):
+    # The audio and recognition modules are only needed once a job runs
+    from audio import load_audio, check_duration
+    from recognition import transcribe, error_response
+    from preprocess import preprocess_audio
+    from backends import get_backend
+
+    with app.app_context():
+        # Claiming with a conditional UPDATE keeps two workers from running the same job
+        claimed = TranscriptionJob.query.filter_by(id=job_id, status=JOB_QUEUED).update(
+            {TranscriptionJob.status: JOB_RUNNING, TranscriptionJob.started_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if not claimed:
+            return
+
+        job = db.session.get(TranscriptionJob, job_id)
+        JOB_WAIT_SECONDS.observe((job.started_at - job.created_at).total_seconds())
+        try:
+            sound = load_audio(job.audio_path, job.audio_format)
+            # create_job refused long recordings from their header; this catches headers that
+            # under-report, as the sync endpoint does after decoding
+            plan = db.session.query(User.subscription_plan).filter_by(id=job.user_id).scalar()
+            check_duration(len(sound) / 1000, PLAN_MAX_DURATION.get(plan))
+            sound, preprocessing = preprocess_audio(sound, app.config)
+            backend = get_backend(job.backend, app.config)
+            offset_ms = preprocessing['offset_ms'] if preprocessing else 0
+            job.result = json.dumps(transcribe(sound, job.language_code, app.config, backend, offset_ms))
+            job.status = JOB_DONE
+        except Exception as e:
+            body, status = error_response(e)
+            job.error = json.dumps(body)
+            job.error_status = status
+            job.status = JOB_FAILED
+
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        JOBS.labels(job.status).inc()
+
+        if job.audio_path and os.path.exists(job.audio_path):
+            os.remove(job.audio_path)
@@ -0,0 +1,141 @@
+import atexit
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from models import db, APIKey, RequestLog
+from usage import increment_rollups
+from metrics import LOG_QUEUE_DEPTH, LOG_FLUSH_SECONDS, LOG_ROWS, LOG_ROWS_DROPPED, LOG_WRITE_RETRIES
+
+class RequestLogWriter:
+    # Buffers RequestLog rows and writes them in bulk from a background thread,
+    # flushing when `batch_size` rows are queued or every `flush_interval` seconds. A batch that
+    # fails to commit is retried `write_retries` times with exponential backoff before it is dropped
+    def __init__(self, app=None, batch_size=100, flush_interval=1.0, max_queue=10000,
+                 write_retries=3, retry_backoff=0.5):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_retries = write_retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = Counter()
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+
+    def submit(self, api_key_id, user_id, user_email, endpoint, count=1):
+        # `count` rows are queued as one item so they are always committed in the same transaction
+        self._ensure_started()
+        with self._pending_lock:
+            self._pending[api_key_id] += count
+        row = {
+            'api_key_id': api_key_id,
+            'user_id': user_id,
+            'user_email': user_email,
+            'endpoint': endpoint,
+            'timestamp': datetime.utcnow()
+        }
+        # Blocks when the queue is full so a stalled database applies backpressure
+        # instead of growing memory without bound
+        self._queue.put([dict(row) for _ in range(count)])
+        LOG_QUEUE_DEPTH.inc()
+
+    def pending(self, api_key_id):
+        # Rows accepted but not yet committed, so quota checks can account for them
+        with self._pending_lock:
+            return self._pending.get(api_key_id, 0)
+
+    def flush(self):
+        with self._flush_lock:
+            while True:
+                rows = self._drain()
+                if not rows:
+                    return
+                self._write_with_retries(rows)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='request-log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            while self._queue.qsize() < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._stop.wait(min(remaining, 0.05))
+            self.flush()
+
+    def _drain(self):
+        rows = []
+        while len(rows) < self.batch_size:
+            try:
+                rows.extend(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            LOG_QUEUE_DEPTH.dec()
+        return rows
+
+    def _write_with_retries(self, rows):
+        # The requests were already charged, so the rows are billing records: a locked database
+        # or a conflicting rollup insert is retried rather than losing them
+        for attempt in range(self.write_retries + 1):
+            if attempt:
+                LOG_WRITE_RETRIES.inc()
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            if self._write(rows):
+                break
+        else:
+            LOG_ROWS_DROPPED.inc(len(rows))
+            self.app.logger.error(
+                "Dropped %d request log entries after %d attempts", len(rows), self.write_retries + 1
+            )
+
+        with self._pending_lock:
+            for row in rows:
+                self._pending[row['api_key_id']] -= 1
+                if self._pending[row['api_key_id']] <= 0:
+                    del self._pending[row['api_key_id']]
+
+    def _write(self, rows):
+        # last_used is filled from the newest row per key in the batch, one UPDATE per key per flush
+        last_used = {}
+        for row in rows:
+            last_used[row['api_key_id']] = max(row['timestamp'], last_used.get(row['api_key_id'], row['timestamp']))
+
+        with self.app.app_context(), LOG_FLUSH_SECONDS.time():
+            try:
+                db.session.bulk_insert_mappings(RequestLog, rows)
+                increment_rollups(rows)
+                db.session.bulk_update_mappings(
+                    APIKey,
+                    [{'id': key_id, 'last_used': ts} for key_id, ts in last_used.items()]
+                )
+                db.session.commit()
+                LOG_ROWS.inc(len(rows))
+                return True
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception("Failed to write %d request log entries", len(rows))
+                return False
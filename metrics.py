@@ -0,0 +1,95 @@
+import os
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Under gunicorn, set PROMETHEUS_MULTIPROC_DIR before starting so every worker writes its samples
+# there and a scrape of any worker reports the totals of all of them
+if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+STAGE_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    'transcription_stage_seconds',
+    'Time spent in each stage of handling a request',
+    ['stage'],
+    buckets=STAGE_BUCKETS
+)
+RESPONSES = Counter(
+    'http_responses_total',
+    'Responses by endpoint and status code',
+    ['endpoint', 'status']
+)
+TRANSCRIPTIONS = Counter(
+    'transcriptions_total',
+    'Finished transcriptions by status: 200, 413 too long, 422 not understood, 503 backend unavailable or 500',
+    ['status']
+)
+AUDIO_SECONDS = Counter('transcription_audio_seconds_total', 'Seconds of decoded audio')
+AUDIO_BYTES = Counter('transcription_audio_bytes_total', 'Bytes of uploaded audio decoded')
+PREPROCESS_BYTES_SAVED = Counter('transcription_preprocess_bytes_saved_total', 'PCM bytes removed by preprocessing')
+CACHE_LOOKUPS = Counter('transcription_cache_lookups_total', 'Transcription cache lookups by result', ['result'])
+LOG_QUEUE_DEPTH = Gauge(
+    'request_log_queue_depth',
+    'Request log batches waiting to be written',
+    multiprocess_mode='livesum'
+)
+LOG_FLUSH_SECONDS = Histogram('request_log_flush_seconds', 'Time to write one batch of request logs', buckets=STAGE_BUCKETS)
+LOG_ROWS = Counter('request_log_rows_total', 'Request log rows written')
+LOG_WRITE_RETRIES = Counter('request_log_write_retries_total', 'Retried request log batch writes')
+LOG_ROWS_DROPPED = Counter('request_log_rows_dropped_total', 'Request log rows dropped after every write attempt failed')
+JOB_WAIT_SECONDS = Histogram(
+    'job_queue_wait_seconds',
+    'Time from job creation until a worker starts it',
+    buckets=STAGE_BUCKETS
+)
+JOBS = Counter('jobs_total', 'Finished jobs by status', ['status'])
+RECOGNITION_RETRIES = Counter('recognition_retries_total', 'Retried remote recognition requests', ['backend'])
+RECOGNITION_HEDGES = Counter('recognition_hedges_total', 'Hedged second requests sent for slow recognitions', ['backend'])
+RECOGNITION_CIRCUIT_OPENS = Counter('recognition_circuit_opens_total', 'Times the recognition circuit breaker opened', ['backend'])
+RECOGNITION_FALLBACKS = Counter(
+    'recognition_fallbacks_total',
+    'Recognitions sent to the fallback backend while the circuit was open',
+    ['backend']
+)
+
+@contextmanager
+def timed(stage):
+    # Observes the block's duration and, inside a request, records it for the Server-Timing header
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        if has_request_context():
+            g.setdefault('timings', []).append((stage, elapsed))
+
+def server_timing(timings):
+    return ', '.join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings)
+
+def render():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def reset_multiprocess_dir():
+    # Drops samples left by the processes of a previous run; call before any worker starts
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not path:
+        return
+    suffix = f"_{os.getpid()}.db"
+    for name in os.listdir(path):
+        if name.endswith('.db') and not name.endswith(suffix):
+            os.remove(os.path.join(path, name))
+
+def mark_process_dead(pid):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
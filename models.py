@@ -1,29 +1,140 @@
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import scoped_session, sessionmaker
 from datetime import datetime
+import sqlite3
+import threading
 import jwt
+from config import Config, engine_options
 
 db = SQLAlchemy()
 
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while a writer holds the lock
+    cursor.execute(f"PRAGMA journal_mode={Config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT * 1000)}")
+    cursor.close()
+
+class ReadDatabase:
+    # A separate session for lookups on the request path, on the READ_DATABASE_URI replica's
+    # engine so they never wait for a connection held by the request log writer. Without a
+    # replica it shares the primary engine, which is the only one that sees an in-memory database
+    def __init__(self):
+        self.app = None
+        self._engine = None
+        self._owns_engine = False
+        # Sessions are removed when the app context tears down, so one per thread is enough
+        self.session = scoped_session(sessionmaker(), scopefunc=threading.get_ident)
+
+    def init_app(self, app):
+        self.app = app
+        app.teardown_appcontext(lambda exception: self.session.remove())
+
+    @property
+    def engine(self):
+        # Resolved on first use, once the app's configuration is final
+        if self._engine is None:
+            config = self.app.config
+            uri = config['READ_DATABASE_URI']
+            if uri:
+                self._engine = create_engine(uri, **engine_options(
+                    uri, config['DB_POOL_SIZE'], config['DB_MAX_OVERFLOW'],
+                    config['DB_POOL_PRE_PING'], config['DB_POOL_RECYCLE'], config['SQLITE_BUSY_TIMEOUT']
+                ))
+                self._owns_engine = True
+            else:
+                self._engine = db.get_engine(self.app)
+            self.session.configure(bind=self._engine)
+        return self._engine
+
+    def query(self, *entities):
+        if self._engine is None:
+            self.engine
+        return self.session.query(*entities)
+
+    def dispose(self):
+        if self._engine is not None and self._owns_engine:
+            self._engine.dispose()
+
+read_db = ReadDatabase()
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     subscription_plan = db.Column(db.String(20), default='free')
-    jwt_token = db.Column(db.String(255), nullable=False, unique=True)
+    jwt_token = db.Column(db.String(255), nullable=False, unique=True, index=True)
     api_keys = db.relationship('APIKey', backref='user', lazy=True)
     request_logs = db.relationship('RequestLog', backref='user', lazy=True)
 
 class APIKey(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    key = db.Column(db.String(50), unique=True, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(50), unique=True, nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_used = db.Column(db.DateTime)
     request_logs = db.relationship('RequestLog', backref='api_key', lazy=True)
 
 class RequestLog(db.Model):
+    __table_args__ = (
+        db.Index('ix_request_log_api_key_id_timestamp', 'api_key_id', 'timestamp'),
+        db.Index('ix_request_log_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     api_key_id = db.Column(db.Integer, db.ForeignKey('api_key.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user_email = db.Column(db.String(120), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    endpoint = db.Column(db.String(50), nullable=False)
\ No newline at end of file
+    endpoint = db.Column(db.String(50), nullable=False)
+
+class UsageRollup(db.Model):
+    # Request counts per key, month and endpoint, kept in step with RequestLog by the log writer
+    __table_args__ = (
+        db.UniqueConstraint('api_key_id', 'month', 'endpoint'),
+        db.Index('ix_usage_rollup_user_id_month', 'user_id', 'month'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    api_key_id = db.Column(db.Integer, db.ForeignKey('api_key.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    month = db.Column(db.Date, nullable=False)
+    endpoint = db.Column(db.String(50), nullable=False)
+    request_count = db.Column(db.Integer, nullable=False, default=0)
+
+class TranscriptionJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    api_key_id = db.Column(db.Integer, db.ForeignKey('api_key.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    language = db.Column(db.String(20), nullable=False)
+    language_code = db.Column(db.String(10), nullable=False)
+    audio_format = db.Column(db.String(10), nullable=False)
+    backend = db.Column(db.String(20), nullable=False, default='google')
+    audio_path = db.Column(db.String(255))
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    error_status = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class CachedTranscription(db.Model):
+    digest = db.Column(db.String(64), primary_key=True)
+    result = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def create_db_app(config=Config):
+    # A bare app with only the database set up, for scripts that use the models without the
+    # web stack or the audio and recognition modules
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    read_db.init_app(app)
+    return app
@@ -0,0 +1,18 @@
+# Monthly request quota per plan
+SUBSCRIPTION_LIMITS = {
+    'free': 50,
+    'silver': 500,
+    'gold': 2000
+}
+
+# Largest request body (bytes) and longest recording (seconds) accepted per plan
+PLAN_MAX_UPLOAD_SIZE = {
+    'free': 10 * 1024 * 1024,
+    'silver': 50 * 1024 * 1024,
+    'gold': 200 * 1024 * 1024
+}
+PLAN_MAX_DURATION = {
+    'free': 5 * 60,
+    'silver': 30 * 60,
+    'gold': 2 * 60 * 60
+}
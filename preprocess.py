@@ -0,0 +1,117 @@
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from pydub import AudioSegment
+
+# Loud recordings are brought down to the target peak, but quiet ones are never boosted by more
+# than this so background noise is not amplified into speech
+MAX_GAIN_DB = 20
+TRIM_FRAME_MS = 10
+FILTER_TAPS = 65
+FILTER_BLOCK = 1 << 15
+
+def preprocess_audio(sound, config):
+    # Returns mono audio ready for the recognizer and, when preprocessing is enabled, stats on
+    # how much smaller the PCM handed to the backend became, how long that took and where in the
+    # upload the kept audio starts (`offset_ms`), so segment times can refer to the original
+    if not config['AUDIO_PREPROCESS']:
+        return sound.set_channels(1), None
+
+    started = time.perf_counter()
+    bytes_in = len(sound.raw_data)
+    duration_in = len(sound)
+
+    target_rate = config['PREPROCESS_SAMPLE_RATE']
+    samples = _to_mono_float(sound)
+    samples = _resample(samples, sound.frame_rate, target_rate)
+    samples, offset = _trim_silence(
+        samples, target_rate, config['PREPROCESS_TRIM_THRESH_DB'], config['PREPROCESS_TRIM_PADDING_MS']
+    )
+    samples = _normalize(samples, config['PREPROCESS_NORMALIZE_DBFS'])
+
+    pcm = np.clip(samples * 32768, -32768, 32767).astype('<i2').tobytes()
+    processed = AudioSegment(pcm, sample_width=2, frame_rate=target_rate, channels=1)
+    return processed, {
+        "bytes_in": bytes_in,
+        "bytes_out": len(pcm),
+        "bytes_saved": bytes_in - len(pcm),
+        "trimmed_ms": duration_in - len(processed),
+        "offset_ms": round(offset * 1000 / target_rate),
+        "time_ms": (time.perf_counter() - started) * 1000
+    }
+
+def _to_mono_float(sound):
+    # Samples as float32 in [-1, 1), averaged over channels
+    if sound.sample_width not in (2, 4):
+        sound = sound.set_sample_width(2)
+    dtype = '<i2' if sound.sample_width == 2 else '<i4'
+    samples = np.frombuffer(sound.raw_data, dtype=dtype).astype(np.float32)
+    samples /= float(2 ** (8 * sound.sample_width - 1))
+    if sound.channels > 1:
+        samples = samples[:len(samples) // sound.channels * sound.channels]
+        samples = samples.reshape(-1, sound.channels).mean(axis=1)
+    return samples
+
+def _lowpass_kernel(cutoff):
+    # Hamming-windowed sinc; `cutoff` is a fraction of the sample rate
+    positions = np.arange(FILTER_TAPS) - (FILTER_TAPS - 1) // 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * positions) * np.hamming(FILTER_TAPS)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+def _resample(samples, source_rate, target_rate):
+    if source_rate == target_rate or not len(samples):
+        return samples
+    length = int(len(samples) * target_rate / source_rate)
+    positions = np.arange(length) * (source_rate / target_rate)
+    if target_rate > source_rate:
+        return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+    # Downsampling needs a low-pass below the new Nyquist frequency so higher frequencies do not
+    # alias into speech; the filter is only evaluated at the source samples each output sample
+    # is interpolated from, block by block to bound memory
+    kernel = _lowpass_kernel(target_rate / source_rate / 2)
+    half = (FILTER_TAPS - 1) // 2
+    windows = sliding_window_view(np.pad(samples, (half, half + 1)), FILTER_TAPS)
+    index = positions.astype(np.int64)
+    fraction = (positions - index).astype(np.float32)
+    # Integer ratios such as 48 kHz to 16 kHz land exactly on source samples
+    interpolate = bool(fraction.any())
+
+    resampled = np.empty(length, dtype=np.float32)
+    for start in range(0, length, FILTER_BLOCK):
+        block = index[start:start + FILTER_BLOCK]
+        left = windows[block] @ kernel
+        if interpolate:
+            right = windows[block + 1] @ kernel
+            left += (right - left) * fraction[start:start + FILTER_BLOCK]
+        resampled[start:start + len(block)] = left
+    return resampled
+
+def _trim_silence(samples, rate, thresh_db, padding_ms):
+    # Drops leading and trailing frames quieter than `thresh_db` below the recording's average
+    # loudness, keeping `padding_ms` around the speech; recordings that are all silence are kept.
+    # Also returns the index of the first kept sample
+    frame = rate * TRIM_FRAME_MS // 1000
+    frames = len(samples) // frame
+    if not frames:
+        return samples, 0
+
+    energy = np.mean(samples[:frames * frame].reshape(frames, frame) ** 2, axis=1)
+    average = np.mean(energy)
+    if average <= 0:
+        return samples, 0
+    voiced = np.flatnonzero(energy > average * 10 ** (-thresh_db / 10))
+    if not len(voiced):
+        return samples, 0
+
+    padding = rate * padding_ms // 1000
+    start = max(0, voiced[0] * frame - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame + padding)
+    return samples[start:end], start
+
+def _normalize(samples, target_dbfs):
+    peak = np.max(np.abs(samples)) if len(samples) else 0
+    if peak <= 0:
+        return samples
+    gain = min(10 ** (target_dbfs / 20) / peak, 10 ** (MAX_GAIN_DB / 20))
+    return samples * np.float32(gain)
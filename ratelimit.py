@@ -0,0 +1,184 @@
+import calendar
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from limits import parse_many
+
+# A counter checked and incremented by `amount` atomically with the others of the same request.
+# `seed` returns the starting count when the counter does not exist yet (None starts from zero).
+Window = namedtuple('Window', ['name', 'key', 'limit', 'expires_at', 'seed', 'amount'], defaults=[1])
+
+class QuotaStore:
+    def hit(self, windows):
+        # Increments every window by its amount if none would go over its limit and returns None,
+        # otherwise changes nothing and returns the first window that would be exceeded
+        raise NotImplementedError
+
+class MemoryQuotaStore(QuotaStore):
+    # Process-local stand-in for tests and single-process development servers
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def hit(self, windows):
+        now = time.time()
+        with self._lock:
+            counts = []
+            for window in windows:
+                entry = self._counters.get(window.key)
+                if entry is None or entry[1] <= now:
+                    current = window.seed() if window.seed else 0
+                else:
+                    current = entry[0]
+                if current + window.amount > window.limit:
+                    return window
+                counts.append(current)
+
+            for window, current in zip(windows, counts):
+                self._counters[window.key] = (current + window.amount, window.expires_at)
+        return None
+
+class SQLiteQuotaStore(QuotaStore):
+    # Counters in a local SQLite file shared by all worker processes on the host; each
+    # request is a single IMMEDIATE transaction
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._hits = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS quota_counters ("
+            "key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        # Connections are per thread and re-opened after a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def hit(self, windows):
+        now = time.time()
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            counts = []
+            for window in windows:
+                row = connection.execute(
+                    "SELECT count FROM quota_counters WHERE key = ? AND expires_at > ?", (window.key, now)
+                ).fetchone()
+                if row is None:
+                    current = window.seed() if window.seed else 0
+                else:
+                    current = row[0]
+                if current + window.amount > window.limit:
+                    connection.execute("ROLLBACK")
+                    return window
+                counts.append(current)
+
+            connection.executemany(
+                "INSERT OR REPLACE INTO quota_counters (key, count, expires_at) VALUES (?, ?, ?)",
+                [(window.key, current + window.amount, window.expires_at) for window, current in zip(windows, counts)]
+            )
+
+            # Drop expired counters now and then so the table stays small
+            self._hits += 1
+            if self._hits % 1000 == 0:
+                connection.execute("DELETE FROM quota_counters WHERE expires_at <= ?", (now,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return None
+
+REDIS_HIT_SCRIPT = """
+local counts = {}
+for i, key in ipairs(KEYS) do
+    local base = 1 + (i - 1) * 4
+    local limit = tonumber(ARGV[base])
+    local seed = tonumber(ARGV[base + 2])
+    local amount = tonumber(ARGV[base + 3])
+    local current = redis.call('GET', key)
+    if current then
+        current = tonumber(current)
+    elseif seed < 0 then
+        return {'seed', i}
+    else
+        current = seed
+    end
+    if current + amount > limit then
+        return {'limit', i}
+    end
+    counts[i] = current
+end
+for i, key in ipairs(KEYS) do
+    local base = 1 + (i - 1) * 4
+    redis.call('SET', key, counts[i] + tonumber(ARGV[base + 3]))
+    redis.call('EXPIREAT', key, ARGV[base + 1])
+end
+return {'ok', 0}
+"""
+
+class RedisQuotaStore(QuotaStore):
+    # Counters in Redis, checked and incremented by one Lua script call per request
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for redis:// quota storage")
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(REDIS_HIT_SCRIPT)
+
+    def hit(self, windows):
+        seeds = [0 if window.seed is None else -1 for window in windows]
+        while True:
+            args = []
+            for window, seed in zip(windows, seeds):
+                args += [window.limit, int(window.expires_at), seed, window.amount]
+            status, index = self._script(keys=[window.key for window in windows], args=args)
+            if status == b'ok':
+                return None
+            window = windows[index - 1]
+            if status == b'limit':
+                return window
+            # The counter is missing, so load its starting value and retry; this only
+            # happens the first time a key is seen in a window
+            seeds[index - 1] = window.seed()
+
+def create_quota_store(uri):
+    if uri.startswith('memory://'):
+        return MemoryQuotaStore()
+    if uri.startswith('sqlite:///'):
+        return SQLiteQuotaStore(uri[len('sqlite:///'):])
+    if uri.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisQuotaStore(uri)
+    raise ValueError(f"Unsupported quota storage URI: {uri}")
+
+class QuotaLimiter:
+    # Enforces short-window rate limits and the monthly plan quota per API key in one store call
+    def __init__(self, store, rate_limits):
+        self.store = store
+        self.rate_limits = parse_many(rate_limits) if rate_limits else []
+
+    def hit(self, api_key_id, monthly_limit, month_start, seed, amount=1):
+        # A batch of `amount` transcriptions is one request for the rate limits but uses `amount`
+        # of the monthly quota
+        now = time.time()
+        windows = []
+        for item in self.rate_limits:
+            expiry = item.get_expiry()
+            bucket = int(now // expiry)
+            windows.append(Window(str(item), f"rate:{api_key_id}:{expiry}:{bucket}", item.amount, (bucket + 1) * expiry, None))
+
+        # month_start is a naive UTC datetime; the counter lives until the next month begins
+        days_in_month = calendar.monthrange(month_start.year, month_start.month)[1]
+        month_end = calendar.timegm(month_start.timetuple()) + days_in_month * 86400
+        windows.append(Window('monthly', f"quota:{api_key_id}:{month_start:%Y-%m}", monthly_limit, month_end, seed, amount))
+        return self.store.hit(windows)
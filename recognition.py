@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import speech_recognition as sr
+from audio import AudioTooLongError, to_audio_data, segment_bounds
+from metrics import timed, TRANSCRIPTIONS
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(max_workers):
+    # Shared across requests so the number of concurrent backend calls stays bounded
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recognition')
+    return _pool
+
+def recognize(sound, language_code, backend):
+    with timed('backend'):
+        return backend.recognize(to_audio_data(sound), language_code)
+
+def _recognize_segment(sound, language_code, backend):
+    try:
+        return recognize(sound, language_code, backend)
+    except sr.UnknownValueError:
+        return ''
+
+def _merge_overlap(previous, text, max_words=5):
+    # Hard-cut segments overlap slightly, so drop words repeated across the boundary
+    prev_words = previous.split()
+    words = text.split()
+    for n in range(min(max_words, len(prev_words), len(words)), 0, -1):
+        if [w.lower() for w in prev_words[-n:]] == [w.lower() for w in words[:n]]:
+            return ' '.join(words[n:])
+    return text
+
+# Segment times are relative to the upload, `offset_ms` being where `sound` starts in it
+def recognize_long(sound, language_code, config, backend, offset_ms=0):
+    bounds = segment_bounds(
+        sound,
+        max_ms=config['SEGMENT_MAX_MS'],
+        overlap_ms=config['SEGMENT_OVERLAP_MS'],
+        search_ms=config['SEGMENT_SILENCE_SEARCH_MS'],
+        min_silence_ms=config['SEGMENT_MIN_SILENCE_MS'],
+        silence_thresh_db=config['SEGMENT_SILENCE_THRESH_DB']
+    )
+    pool = get_pool(config['RECOGNITION_WORKERS'])
+    futures = [pool.submit(_recognize_segment, sound[start:end], language_code, backend) for start, end in bounds]
+
+    try:
+        texts = [future.result() for future in futures]
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+
+    segments = []
+    previous = ''
+    previous_end = 0
+    for (start, end), text in zip(bounds, texts):
+        if previous and text and start < previous_end:
+            text = _merge_overlap(previous, text)
+        if text:
+            previous = text
+        previous_end = end
+        segments.append({
+            "start": (start + offset_ms) / 1000,
+            "end": (end + offset_ms) / 1000,
+            "text": text
+        })
+
+    text = ' '.join(segment['text'] for segment in segments if segment['text'])
+    if not text:
+        raise sr.UnknownValueError()
+    return text, segments
+
+def transcribe(sound, language_code, config, backend, offset_ms=0):
+    if len(sound) > config['LONG_AUDIO_THRESHOLD_MS']:
+        text, segments = recognize_long(sound, language_code, config, backend, offset_ms)
+        result = {"text": text, "segments": segments}
+    else:
+        result = {"text": recognize(sound, language_code, backend)}
+    TRANSCRIPTIONS.labels('200').inc()
+    return result
+
+def error_response(e):
+    body, status = _error_response(e)
+    TRANSCRIPTIONS.labels(str(status)).inc()
+    return body, status
+
+def _error_response(e):
+    # Error body and status for a failed transcription, shared by the sync endpoint and jobs
+    if isinstance(e, sr.UnknownValueError):
+        return {
+            "error": "Speech recognition failed",
+            "message": "Could not understand the audio content"
+        }, 422
+
+    if isinstance(e, AudioTooLongError):
+        return {
+            "error": "Audio too long",
+            "message": str(e)
+        }, 413
+
+    if isinstance(e, sr.RequestError):
+        return {
+            "error": "Service error",
+            "message": f"Could not request results from speech recognition service; {str(e)}"
+        }, 503
+
+    return {
+        "error": "Processing error",
+        "message": str(e)
+    }, 500
@@ -0,0 +1,74 @@
+import random
+import threading
+import time
+from collections import deque
+import speech_recognition as sr
+
+class RetryableRequestError(sr.RequestError):
+    # Timeouts, connection failures, throttling and server errors that may succeed when retried
+    pass
+
+class CircuitOpenError(sr.RequestError):
+    pass
+
+def backoff_delay(attempt, base):
+    # "Full jitter": a random wait of up to base * 2^attempt, so clients retrying after the same
+    # failure do not hit the service again in lockstep
+    return random.uniform(0, base * 2 ** attempt)
+
+class CircuitBreaker:
+    # Opens when at least `error_rate` of the last `window` calls failed (once `min_calls` calls
+    # were seen) and rejects calls for `reset_timeout` seconds; then a single trial call decides
+    # whether it closes again or stays open for another period
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, window=20, min_calls=10, error_rate=0.5, reset_timeout=30):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record(self, success):
+        # Returns True when this outcome opened the circuit
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+                if success:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    return False
+                self._open()
+                return True
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self.state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures >= self.error_rate * len(self._outcomes)):
+                self._open()
+                return True
+            return False
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
@@ -0,0 +1,56 @@
+import threading
+import time
+
+class WorkerResources:
+    # Builds and warms recognition backends and the decoder once per worker process, and
+    # records how long startup took and how long requests spend obtaining a ready backend
+    def __init__(self):
+        self.startup_seconds = None
+        self.warm_up_errors = {}
+        self._setup_count = 0
+        self._setup_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        from audio import warm_up_decoder
+        from backends import get_backend
+
+        started = time.perf_counter()
+        names = set(app.config['ALLOWED_RECOGNITION_BACKENDS']) | {app.config['RECOGNITION_BACKEND']}
+        for name in sorted(names):
+            try:
+                get_backend(name, app.config).warm_up()
+            except Exception as e:
+                # A backend that cannot warm up still fails per request with a clear error
+                self.warm_up_errors[name] = str(e)
+                app.logger.warning("Could not warm up %s backend: %s", name, e)
+
+        if app.config['DECODER_WARM_UP']:
+            try:
+                warm_up_decoder()
+            except Exception as e:
+                self.warm_up_errors['decoder'] = str(e)
+                app.logger.warning("Could not warm up audio decoder: %s", e)
+
+        self.startup_seconds = time.perf_counter() - started
+        app.logger.info("Worker resources ready in %.1f ms", self.startup_seconds * 1000)
+
+    def backend(self, name, config):
+        from backends import get_backend
+
+        started = time.perf_counter()
+        backend = get_backend(name, config)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._setup_count += 1
+            self._setup_seconds += elapsed
+        return backend
+
+    def stats(self):
+        with self._lock:
+            return {
+                "startup_ms": None if self.startup_seconds is None else self.startup_seconds * 1000,
+                "requests": self._setup_count,
+                "avg_setup_ms": self._setup_seconds * 1000 / self._setup_count if self._setup_count else 0.0,
+                "warm_up_errors": self.warm_up_errors
+            }
@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+from gunicorn.app.base import BaseApplication
+from app import create_app, preload_audio_modules, db, job_manager, request_log_writer, worker_resources
+from models import read_db
+from metrics import reset_multiprocess_dir, mark_process_dead
+from config import Config
+
+app = create_app()
+
+def on_starting(server):
+    # Runs once in the master before any worker starts, so interrupted jobs can be reset safely
+    job_manager.requeue_interrupted()
+    reset_multiprocess_dir()
+    if Config.PRELOAD_AUDIO_MODULES:
+        preload_audio_modules()
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared with the forked workers
+    with app.app_context():
+        db.engine.dispose()
+    read_db.dispose()
+
+    worker_resources.init_app(app)
+    job_manager.resume()
+
+def worker_exit(server, worker):
+    # Give in-flight jobs a chance to finish, then write any buffered request logs
+    job_manager.shutdown(wait=True)
+    request_log_writer.stop()
+    mark_process_dead(worker.pid)
+
+class ProductionServer(BaseApplication):
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+def server_options(config):
+    options = {
+        'bind': f"{config.SERVER_HOST}:{config.SERVER_PORT}",
+        'workers': config.SERVER_WORKERS or multiprocessing.cpu_count() * 2 + 1,
+        'threads': config.SERVER_THREADS,
+        'worker_class': 'gthread',
+        'timeout': config.SERVER_TIMEOUT,
+        'graceful_timeout': config.SERVER_GRACEFUL_TIMEOUT,
+        'keepalive': config.SERVER_KEEPALIVE,
+        'max_requests': config.SERVER_MAX_REQUESTS,
+        'max_requests_jitter': config.SERVER_MAX_REQUESTS // 10,
+        # The app is imported once in the master and forked, so workers start without re-importing it
+        'preload_app': True,
+        'on_starting': on_starting,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+
+    # Check if SSL certificates exist
+    if os.path.exists(config.SSL_CERTFILE) and os.path.exists(config.SSL_KEYFILE):
+        options['certfile'] = config.SSL_CERTFILE
+        options['keyfile'] = config.SSL_KEYFILE
+    return options
+
+if __name__ == '__main__':
+    # Send SIGHUP to the master process to reload workers gracefully
+    ProductionServer(app, server_options(Config)).run()
@@ -0,0 +1,158 @@
+import json
+import struct
+from collections import deque
+from pydub import AudioSegment
+import speech_recognition as sr
+from audio import find_silence_cut, check_duration
+from recognition import get_pool, recognize, error_response
+from metrics import TRANSCRIPTIONS
+
+WAV_MIMETYPES = ('audio/wav', 'audio/x-wav', 'audio/wave')
+PCM_MIMETYPES = ('audio/l16', 'audio/pcm')
+MAX_CHANNELS = 8
+MAX_FRAME_RATE = 192000
+SAMPLE_WIDTHS = (1, 2, 4)
+
+class StreamFormatError(ValueError):
+    pass
+
+def _read_exact(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise StreamFormatError("Unexpected end of stream in WAV header")
+        data += chunk
+    return data
+
+def read_wav_header(stream):
+    # Consumes the RIFF header up to the start of the sample data; the data chunk size is
+    # ignored because streaming encoders usually cannot know it in advance
+    riff, _, wave = struct.unpack('<4sI4s', _read_exact(stream, 12))
+    if riff != b'RIFF' or wave != b'WAVE':
+        raise StreamFormatError("Stream is not a WAV file")
+
+    fmt = None
+    while True:
+        chunk_id, chunk_size = struct.unpack('<4sI', _read_exact(stream, 8))
+        if chunk_id == b'data':
+            break
+        body = _read_exact(stream, chunk_size + chunk_size % 2)
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack('<HHIIHH', body[:16])
+
+    if fmt is None:
+        raise StreamFormatError("WAV stream has no fmt chunk")
+    audio_format, channels, frame_rate, _, _, bits_per_sample = fmt
+    if audio_format != 1:
+        raise StreamFormatError("Only PCM WAV streams are supported")
+    return channels, frame_rate, bits_per_sample // 8
+
+def stream_parameters(stream, mimetype, params):
+    if mimetype in PCM_MIMETYPES:
+        try:
+            parameters = int(params.get('channels', 1)), int(params.get('rate', 16000)), 2
+        except ValueError:
+            raise StreamFormatError("channels and rate must be integers")
+    elif mimetype in WAV_MIMETYPES or not mimetype:
+        parameters = read_wav_header(stream)
+    else:
+        raise StreamFormatError(f"Unsupported stream content type: {mimetype}")
+    return _check_parameters(*parameters)
+
+def _check_parameters(channels, frame_rate, sample_width):
+    if not 1 <= channels <= MAX_CHANNELS:
+        raise StreamFormatError(f"channels must be between 1 and {MAX_CHANNELS}")
+    if not 1 <= frame_rate <= MAX_FRAME_RATE:
+        raise StreamFormatError(f"rate must be between 1 and {MAX_FRAME_RATE}")
+    if sample_width not in SAMPLE_WIDTHS:
+        raise StreamFormatError(f"Only {', '.join(str(width * 8) for width in SAMPLE_WIDTHS)}-bit samples are supported")
+    return channels, frame_rate, sample_width
+
+def _recognize_window(sound, language_code, backend):
+    try:
+        return recognize(sound, language_code, backend)
+    except sr.UnknownValueError:
+        return ''
+
+def transcribe_stream(stream, channels, frame_rate, sample_width, language_code, backend, config, max_duration=None):
+    # Cuts the incoming PCM into windows of at most STREAM_WINDOW_MS (at a pause when one is
+    # found near the end), recognizes them concurrently and yields results in order as they finish;
+    # the stream fails once it runs longer than `max_duration` seconds. Reading pauses while
+    # STREAM_MAX_PENDING_WINDOWS windows are still being recognized
+    frame_width = channels * sample_width
+    bytes_per_ms = frame_rate * frame_width / 1000
+    window_ms = config['STREAM_WINDOW_MS']
+    window_bytes = int(window_ms * bytes_per_ms) // frame_width * frame_width
+    pool = get_pool(config['RECOGNITION_WORKERS'])
+    max_pending = max(1, config['STREAM_MAX_PENDING_WINDOWS'])
+
+    pending = deque()
+    texts = []
+    buffer = bytearray()
+    offset_ms = 0
+
+    def to_sound(data):
+        return AudioSegment(bytes(data), sample_width=sample_width, frame_rate=frame_rate, channels=channels).set_channels(1)
+
+    def completed(wait, keep=0):
+        # Finished windows in order; with `wait`, blocks until at most `keep` are pending
+        while pending and (pending[0][2].done() or (wait and len(pending) > keep)):
+            start, end, future = pending.popleft()
+            text = future.result()
+            if text:
+                texts.append(text)
+                yield {"type": "partial", "start": start / 1000, "end": end / 1000, "text": text}
+
+    try:
+        finished = False
+        while not finished:
+            chunk = stream.read(config['STREAM_CHUNK_SIZE'])
+            finished = not chunk
+            buffer.extend(chunk)
+            check_duration((offset_ms + len(buffer) / bytes_per_ms) / 1000, max_duration)
+
+            while len(buffer) >= window_bytes or (finished and len(buffer) >= frame_width):
+                if len(buffer) >= window_bytes:
+                    window = to_sound(buffer[:window_bytes])
+                    cut = find_silence_cut(
+                        window, 0, window_ms,
+                        config['SEGMENT_SILENCE_SEARCH_MS'],
+                        config['SEGMENT_MIN_SILENCE_MS'],
+                        window.dBFS - config['SEGMENT_SILENCE_THRESH_DB']
+                    ) or window_ms
+                    cut_bytes = int(cut * bytes_per_ms) // frame_width * frame_width
+                else:
+                    cut_bytes = len(buffer) // frame_width * frame_width
+
+                cut_ms = cut_bytes / bytes_per_ms
+                sound = to_sound(buffer[:cut_bytes])
+                future = pool.submit(_recognize_window, sound, language_code, backend)
+                pending.append((offset_ms, offset_ms + cut_ms, future))
+                del buffer[:cut_bytes]
+                offset_ms += cut_ms
+                if len(pending) >= max_pending:
+                    yield from completed(wait=True, keep=max_pending - 1)
+
+            yield from completed(wait=False)
+
+        yield from completed(wait=True)
+    except Exception as e:
+        for _, _, future in pending:
+            future.cancel()
+        body, status = error_response(e)
+        yield {"type": "error", "status": status, **body}
+        return
+
+    if not texts:
+        body, status = error_response(sr.UnknownValueError())
+        yield {"type": "error", "status": status, **body}
+        return
+
+    TRANSCRIPTIONS.labels('200').inc()
+    yield {"type": "final", "duration": offset_ms / 1000, "text": ' '.join(texts)}
+
+def format_event(event, ndjson=False):
+    if ndjson:
+        return json.dumps(event) + '\n'
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,90 @@
+import io
+import math
+import os
+import struct
+import sys
+import tempfile
+import wave
+import pytest
+
+# The modules live at the top level of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Config reads the environment when it is first imported, so the test settings are in place
+# before any test module imports the app
+TEST_DIR = tempfile.mkdtemp(prefix='vocaltranscribe-tests-')
+os.environ.update({
+    'DATABASE_URI': f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}",
+    'UPLOAD_FOLDER': os.path.join(TEST_DIR, 'uploads'),
+    'QUOTA_STORAGE_URI': 'memory://',
+    'RECOGNITION_BACKEND': 'stub',
+    'ALLOWED_RECOGNITION_BACKENDS': 'stub',
+    'JOB_WORKER_TYPE': 'inline',
+    'TRANSCRIPTION_CACHE_PERSIST': 'false',
+    'METRICS_TOKEN': '',
+})
+
+def wav_bytes(seconds=1.0, rate=16000, channels=1, silence=0.0):
+    # A tone of `seconds`, after `silence` seconds of silence, as a 16-bit WAV file
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b'\0\0' * channels * int(silence * rate))
+        wav.writeframes(b''.join(
+            struct.pack('<h', int(8000 * math.sin(i / 20))) * channels for i in range(int(seconds * rate))
+        ))
+    return buffer.getvalue()
+
+@pytest.fixture(scope='session')
+def app():
+    import app as server
+    return server.create_app()
+
+@pytest.fixture
+def client(app):
+    # Every test starts from an empty database and empty caches and quota counters
+    import app as server
+    from models import db
+    from ratelimit import MemoryQuotaStore
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    server.api_key_cache.clear()
+    server.transcription_cache.clear()
+    server.quota_limiter.store = MemoryQuotaStore()
+    yield app.test_client()
+    server.request_log_writer.flush()
+
+@pytest.fixture
+def make_api_key(app, client):
+    from models import db, User, APIKey
+
+    def make_api_key(plan='free', email='user@example.com'):
+        with app.app_context():
+            user = User(email=email, subscription_plan=plan, jwt_token=f"token-{email}")
+            db.session.add(user)
+            db.session.commit()
+            key = f"{email:x<50}"[:50]
+            db.session.add(APIKey(key=key, user_id=user.id))
+            db.session.commit()
+        return key
+    return make_api_key
+
+@pytest.fixture
+def api_key(make_api_key):
+    return make_api_key()
+
+@pytest.fixture
+def logged_requests(app):
+    # Number of RequestLog rows written so far, after flushing the background writer
+    import app as server
+    from models import RequestLog
+
+    def logged_requests():
+        server.request_log_writer.flush()
+        with app.app_context():
+            return RequestLog.query.count()
+    return logged_requests
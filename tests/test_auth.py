@@ -0,0 +1,120 @@
+import io
+import pytest
+import auth
+from auth import APIKeyCache, new_api_key, API_KEY_ALPHABET
+from conftest import wav_bytes
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth.time, 'monotonic', lambda: now[0])
+    return now
+
+class Loader:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, key):
+        self.calls.append(key)
+        return None if key == 'unknown' else f"value of {key}"
+
+def test_lookup_is_cached_until_ttl(clock):
+    cache = APIKeyCache(ttl=60)
+    loader = Loader()
+    assert cache.lookup('a', loader) == 'value of a'
+    clock[0] += 59
+    assert cache.lookup('a', loader) == 'value of a'
+    assert loader.calls == ['a']
+    clock[0] += 1
+    assert cache.lookup('a', loader) == 'value of a'
+    assert loader.calls == ['a', 'a']
+
+def test_unknown_keys_are_cached(clock):
+    cache = APIKeyCache(ttl=60)
+    loader = Loader()
+    assert cache.lookup('unknown', loader) is None
+    assert cache.lookup('unknown', loader) is None
+    assert loader.calls == ['unknown']
+
+def test_invalidate_and_clear(clock):
+    cache = APIKeyCache(ttl=60)
+    loader = Loader()
+    cache.lookup('a', loader)
+    cache.lookup('b', loader)
+    cache.invalidate('a')
+    cache.lookup('a', loader)
+    cache.lookup('b', loader)
+    assert loader.calls == ['a', 'b', 'a']
+    cache.clear()
+    cache.lookup('b', loader)
+    assert loader.calls == ['a', 'b', 'a', 'b']
+
+def test_least_recently_used_is_evicted(clock):
+    cache = APIKeyCache(ttl=60, maxsize=2)
+    loader = Loader()
+    cache.lookup('a', loader)
+    cache.lookup('b', loader)
+    cache.lookup('a', loader)
+    cache.lookup('c', loader)
+    cache.lookup('a', loader)
+    cache.lookup('b', loader)
+    assert loader.calls == ['a', 'b', 'c', 'b']
+
+def test_new_api_key():
+    key = new_api_key()
+    assert len(key) == 50
+    assert set(key) <= set(API_KEY_ALPHABET)
+
+def upload(client, key, data=None, **kwargs):
+    return client.post(
+        '/speech-to-text', headers={'X-API-Key': key}, data=data or {},
+        content_type='multipart/form-data', **kwargs
+    )
+
+def test_require_api_key(client, api_key):
+    assert client.post('/speech-to-text').status_code == 401
+    assert upload(client, 'x' * 50).status_code == 401
+    response = upload(client, api_key, {'audio': (io.BytesIO(wav_bytes()), 'speech.wav')})
+    assert response.status_code == 200
+    assert response.get_json()['text'].startswith('stub en-US 1.00s')
+
+def test_request_is_charged_before_the_body_is_read(client, api_key, logged_requests, monkeypatch):
+    import app as server
+    monkeypatch.setitem(server.SUBSCRIPTION_LIMITS, 'free', 2)
+    # A body without audio is rejected only after the request was charged
+    assert upload(client, api_key).status_code == 400
+    assert logged_requests() == 1
+    assert upload(client, api_key).status_code == 400
+    response = upload(client, api_key)
+    assert response.status_code == 429
+    assert response.get_json()['error'] == 'Monthly request limit exceeded'
+    assert logged_requests() == 2
+
+def test_upload_size_is_checked_before_the_quota(client, api_key, logged_requests, monkeypatch):
+    import app as server
+    monkeypatch.setitem(server.SUBSCRIPTION_LIMITS, 'free', 0)
+    monkeypatch.setitem(server.PLAN_MAX_UPLOAD_SIZE, 'free', 1000)
+    response = upload(client, api_key, {'audio': (io.BytesIO(wav_bytes()), 'speech.wav')})
+    assert response.status_code == 413
+    assert upload(client, api_key).status_code == 429
+    assert logged_requests() == 0
+
+def test_rate_limit_sets_retry_after(client, api_key, monkeypatch):
+    import app as server
+    from ratelimit import MemoryQuotaStore, QuotaLimiter
+    monkeypatch.setattr(server, 'quota_limiter', QuotaLimiter(MemoryQuotaStore(), '1 per hour'))
+    assert upload(client, api_key).status_code == 400
+    response = upload(client, api_key)
+    assert response.status_code == 429
+    assert 0 < int(response.headers['Retry-After']) <= 3600
+
+def test_deleted_key_is_rejected_after_invalidation(app, client, api_key, logged_requests):
+    import app as server
+    from models import db, APIKey
+    assert upload(client, api_key).status_code == 400
+    assert logged_requests() == 1
+    with app.app_context():
+        APIKey.query.filter_by(key=api_key).delete()
+        db.session.commit()
+    server.api_key_cache.invalidate(api_key)
+    assert upload(client, api_key).status_code == 401
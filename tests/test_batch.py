@@ -0,0 +1,103 @@
+import io
+import json
+import tarfile
+import zipfile
+import pytest
+from werkzeug.datastructures import FileStorage
+from batch import ArchiveError, extract_archive
+from conftest import wav_bytes
+
+def zip_archive(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return FileStorage(stream=buffer, filename='clips.zip')
+
+def tar_archive(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return FileStorage(stream=buffer, filename='clips.tar.gz')
+
+@pytest.mark.parametrize('build', [zip_archive, tar_archive])
+def test_members_are_named_by_path(build):
+    files = extract_archive(build({'a/x.wav': b'one', 'b/x.wav': b'two'}), 10, 100, 1000)
+    assert {f.filename: f.read() for f in files} == {'a/x.wav': b'one', 'b/x.wav': b'two'}
+
+@pytest.mark.parametrize('build', [zip_archive, tar_archive])
+def test_too_many_files(build):
+    with pytest.raises(ArchiveError, match='more than 2 files'):
+        extract_archive(build({f'{i}.wav': b'x' for i in range(3)}), 2, 100, 1000)
+
+@pytest.mark.parametrize('build', [zip_archive, tar_archive])
+def test_member_too_large(build):
+    with pytest.raises(ArchiveError, match='larger than 10 bytes'):
+        extract_archive(build({'x.wav': b'x' * 11}), 10, 10, 1000)
+
+def test_total_size_limit():
+    # Each member is allowed, but together they decompress to more than the budget
+    archive = zip_archive({f'{i}.wav': b'\0' * 1000 for i in range(5)})
+    with pytest.raises(ArchiveError, match='larger than 4000 bytes'):
+        extract_archive(archive, 10, 1000, 4000)
+
+def test_members_use_open_member():
+    opened = []
+    def open_member(size, name):
+        opened.append((size, name))
+        return io.BytesIO()
+    extract_archive(zip_archive({'x.wav': b'abc'}), 10, 100, 1000, open_member)
+    assert opened == [(3, 'x.wav')]
+
+def test_not_an_archive():
+    with pytest.raises(ArchiveError):
+        extract_archive(FileStorage(stream=io.BytesIO(b'not an archive'), filename='x.zip'), 10, 100, 1000)
+
+def corrupt_zip():
+    archive = zip_archive({'x.wav': bytes(range(256)) * 40})
+    data = bytearray(archive.stream.getvalue())
+    # Flip a byte of the compressed member data, after its 30-byte local header and name
+    data[30 + len('x.wav') + 20] ^= 0xff
+    return io.BytesIO(bytes(data))
+
+def test_corrupt_zip_member():
+    with pytest.raises(ArchiveError, match='could not be read'):
+        extract_archive(FileStorage(stream=corrupt_zip(), filename='clips.zip'), 10, 100000, 100000)
+
+def test_truncated_tar_member():
+    data = tar_archive({'x.wav': bytes(range(256)) * 400}).stream.getvalue()
+    with pytest.raises(ArchiveError):
+        extract_archive(FileStorage(stream=io.BytesIO(data[:len(data) // 2]), filename='clips.tar.gz'), 10, 200000, 200000)
+
+def batch(client, key, data):
+    return client.post(
+        '/speech-to-text/batch', headers={'X-API-Key': key}, data=data, content_type='multipart/form-data'
+    )
+
+def test_batch_endpoint(client, api_key, logged_requests):
+    archive = zip_archive({'a/x.wav': wav_bytes(0.5), 'b/x.wav': wav_bytes(0.5), 'notes.txt': b'hello'})
+    response = batch(client, api_key, {
+        'audio': [(io.BytesIO(wav_bytes()), 'one.wav')],
+        'archive': (archive.stream, 'clips.zip'),
+        'languages': json.dumps({'b/x.wav': 'german'}),
+    })
+    assert response.status_code == 200
+    body = response.get_json()
+    results = {result['filename']: result for result in body['results']}
+    assert results['one.wav']['text'].startswith('stub en-US 1.00s')
+    assert results['a/x.wav']['language_code'] == 'en-US'
+    assert results['b/x.wav']['language_code'] == 'de-DE'
+    assert results['notes.txt']['status'] == 400
+    assert body['charged'] == 3
+    assert logged_requests() == 3
+
+def test_batch_with_a_corrupt_archive(client, api_key, logged_requests):
+    response = batch(client, api_key, {'archive': (corrupt_zip(), 'clips.zip')})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid archive'
+    assert logged_requests() == 0
@@ -0,0 +1,42 @@
+import io
+import pytest
+from conftest import wav_bytes
+
+def transcribe(client, key, audio, headers=None, **form):
+    return client.post(
+        '/speech-to-text', headers={'X-API-Key': key, **(headers or {})},
+        data={'audio': (io.BytesIO(audio), 'speech.wav'), **form}, content_type='multipart/form-data'
+    )
+
+def test_repeated_upload_is_served_from_the_cache(client, api_key, logged_requests, monkeypatch):
+    audio = wav_bytes()
+    first = transcribe(client, api_key, audio)
+    assert first.headers['X-Cache'] == 'MISS'
+
+    import recognition
+    monkeypatch.setattr(recognition, 'transcribe', lambda *args: pytest.fail("recognized a cached upload"))
+    second = transcribe(client, api_key, audio)
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_json() == first.get_json()
+    # Cache hits still count against the quota
+    assert logged_requests() == 2
+
+    stats = client.get('/cache/stats', headers={'X-API-Key': api_key}).get_json()
+    assert stats['hits'] >= 1
+    assert stats['size'] == 1
+
+def test_cache_is_keyed_by_language(client, api_key):
+    audio = wav_bytes()
+    assert transcribe(client, api_key, audio).headers['X-Cache'] == 'MISS'
+    response = transcribe(client, api_key, audio, language='french')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.get_json()['text'].startswith('stub fr-FR')
+
+def test_no_cache_bypasses_the_cache(client, api_key):
+    audio = wav_bytes()
+    transcribe(client, api_key, audio)
+    response = transcribe(client, api_key, audio, headers={'Cache-Control': 'no-cache'})
+    assert response.headers['X-Cache'] == 'BYPASS'
+
+def test_cache_stats_require_an_api_key(client):
+    assert client.get('/cache/stats').status_code == 401
@@ -0,0 +1,41 @@
+import io
+import pytest
+import create_account
+from create_account import import_accounts, parse_account
+from models import User, APIKey
+
+def test_parse_account():
+    assert parse_account({'email': ' a@example.com ', 'plan': 'gold', 'keys': '2'}, 'free', 1) == ('a@example.com', 'gold', 2)
+    assert parse_account({'email': 'a@example.com', 'keys': ''}, 'free', 1) == ('a@example.com', 'free', 1)
+
+@pytest.mark.parametrize('row', [
+    None,
+    ['a@example.com'],
+    {'plan': 'gold'},
+    {'email': 7},
+    {'email': 'a@example.com', 'plan': 'platinum'},
+    {'email': 'a@example.com', 'plan': 5},
+    {'email': 'a@example.com', 'keys': 'two'},
+    {'email': 'a@example.com', 'keys': 2.5},
+    {'email': 'a@example.com', 'keys': -1},
+])
+def test_parse_invalid_account(row):
+    with pytest.raises(ValueError):
+        parse_account(row, 'free', 1)
+
+def test_import_skips_invalid_rows(client, capsys):
+    rows = [
+        {'email': 'a@example.com', 'plan': 'silver', 'keys': 2},
+        {'email': 'b@example.com', 'keys': 'two'},
+        None,
+        {'email': 'a@example.com'},
+        {'email': 'c@example.com', 'keys': 0},
+    ]
+    output = io.StringIO()
+    assert import_accounts(rows, 'free', 1, 2, output) == (2, 3)
+    assert 'Skipping row 2' in capsys.readouterr().err
+    assert len(output.getvalue().splitlines()) == 1 + 2 + 1
+
+    with create_account.app.app_context():
+        assert {user.email: len(user.api_keys) for user in User.query} == {'a@example.com': 2, 'c@example.com': 0}
+        assert APIKey.query.count() == 2
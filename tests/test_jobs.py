@@ -0,0 +1,45 @@
+import io
+from conftest import wav_bytes
+from jobs import JOB_DONE, JOB_RUNNING, run_job
+from models import db, TranscriptionJob
+
+def submit(client, key, data):
+    return client.post('/jobs', headers={'X-API-Key': key}, data=data, content_type='multipart/form-data')
+
+def test_job_is_transcribed_and_polled(client, api_key):
+    response = submit(client, api_key, {'audio': (io.BytesIO(wav_bytes()), 'speech.wav'), 'language': 'german'})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+
+    job = client.get(f'/jobs/{job_id}', headers={'X-API-Key': api_key}).get_json()
+    assert job['status'] == JOB_DONE
+    assert job['language_code'] == 'de-DE'
+    assert job['result']['text'].startswith('stub de-DE 1.00s')
+
+def test_jobs_are_private_to_their_user(client, make_api_key):
+    owner = make_api_key()
+    other = make_api_key(email='other@example.com')
+    job_id = submit(client, owner, {'audio': (io.BytesIO(wav_bytes()), 'speech.wav')}).get_json()['id']
+    assert client.get(f'/jobs/{job_id}', headers={'X-API-Key': other}).status_code == 404
+    assert client.get('/jobs/missing', headers={'X-API-Key': owner}).status_code == 404
+
+def test_invalid_upload_is_not_queued(app, client, api_key):
+    response = submit(client, api_key, {'audio': (io.BytesIO(b'not audio'), 'speech.wav')})
+    assert response.status_code == 400
+    with app.app_context():
+        assert TranscriptionJob.query.count() == 0
+
+def test_claimed_job_is_not_run_again(app, client, api_key):
+    job_id = submit(client, api_key, {'audio': (io.BytesIO(wav_bytes()), 'speech.wav')}).get_json()['id']
+    with app.app_context():
+        job = db.session.get(TranscriptionJob, job_id)
+        job.status = JOB_RUNNING
+        job.result = None
+        db.session.commit()
+
+    # Another worker holds the job, so this one leaves it alone
+    run_job(app, job_id)
+    with app.app_context():
+        job = db.session.get(TranscriptionJob, job_id)
+        assert job.status == JOB_RUNNING
+        assert job.result is None
@@ -0,0 +1,47 @@
+import io
+import pytest
+from conftest import wav_bytes
+from plans import PLAN_MAX_DURATION, PLAN_MAX_UPLOAD_SIZE
+
+@pytest.fixture
+def short_free_plan(monkeypatch):
+    monkeypatch.setitem(PLAN_MAX_DURATION, 'free', 1)
+
+def post(client, path, key, audio):
+    return client.post(
+        path, headers={'X-API-Key': key}, data={'audio': (io.BytesIO(audio), 'speech.wav')},
+        content_type='multipart/form-data'
+    )
+
+def test_upload_larger_than_the_plan_allows(client, api_key, monkeypatch):
+    monkeypatch.setitem(PLAN_MAX_UPLOAD_SIZE, 'free', 20000)
+    assert post(client, '/speech-to-text', api_key, wav_bytes(0.5)).status_code == 200
+    assert post(client, '/speech-to-text', api_key, wav_bytes(1)).status_code == 413
+
+def test_recording_longer_than_the_plan_allows(client, api_key, short_free_plan, monkeypatch):
+    import app as server
+    decoded = []
+    monkeypatch.setattr(server, 'decode_audio', lambda *args: decoded.append(args))
+    response = post(client, '/speech-to-text', api_key, wav_bytes(2))
+    assert response.status_code == 413
+    # Refused from the header, before decoding
+    assert decoded == []
+
+def test_job_longer_than_the_plan_allows(client, api_key, short_free_plan):
+    assert post(client, '/jobs', api_key, wav_bytes(2)).status_code == 413
+
+def test_job_with_an_under_reporting_header(client, api_key, short_free_plan, monkeypatch):
+    import app as server
+    monkeypatch.setattr(server, 'probe_duration', lambda *args: 0)
+    response = post(client, '/jobs', api_key, wav_bytes(2))
+    assert response.status_code == 202
+    job = client.get(f"/jobs/{response.get_json()['id']}", headers={'X-API-Key': api_key}).get_json()
+    assert job['status'] == 'failed'
+    assert job['status_code'] == 413
+
+def test_cached_result_is_not_served_past_the_plan_limit(client, make_api_key, short_free_plan):
+    audio = wav_bytes(2)
+    gold = make_api_key('gold', 'gold@example.com')
+    free = make_api_key('free', 'free@example.com')
+    assert post(client, '/speech-to-text', gold, audio).status_code == 200
+    assert post(client, '/speech-to-text', free, audio).status_code == 413
@@ -0,0 +1,63 @@
+from datetime import datetime
+import pytest
+from logwriter import RequestLogWriter
+from prometheus_client import REGISTRY
+from models import RequestLog, UsageRollup
+
+def sample(name):
+    return REGISTRY.get_sample_value(name) or 0
+
+@pytest.fixture
+def writer(app, client):
+    writer = RequestLogWriter(app, batch_size=10, flush_interval=60, write_retries=2, retry_backoff=0)
+    # Rows are only written by explicit flushes
+    writer._ensure_started = lambda: None
+    return writer
+
+def test_rows_are_pending_until_flushed(app, writer, make_api_key):
+    make_api_key()
+    make_api_key(email='other@example.com')
+    writer.submit(1, 1, 'user@example.com', 'speech_to_text')
+    writer.submit(1, 1, 'user@example.com', 'speech_to_text_batch', count=3)
+    writer.submit(2, 1, 'user@example.com', 'speech_to_text')
+    assert writer.pending(1) == 4
+    assert writer.pending(2) == 1
+
+    writer.flush()
+    assert writer.pending(1) == 0
+    assert writer.pending(2) == 0
+    with app.app_context():
+        assert RequestLog.query.count() == 5
+        counts = {(r.api_key_id, r.endpoint): r.request_count for r in UsageRollup.query}
+        assert counts == {(1, 'speech_to_text'): 1, (1, 'speech_to_text_batch'): 3, (2, 'speech_to_text'): 1}
+        assert RequestLog.query.first().api_key.last_used is not None
+
+def test_failed_writes_are_retried(app, writer, api_key):
+    failures = [True]
+    write = writer._write
+    def flaky_write(rows):
+        if failures:
+            failures.pop()
+            return False
+        return write(rows)
+    writer._write = flaky_write
+
+    retries = sample('request_log_write_retries_total')
+    writer.submit(1, 1, 'user@example.com', 'speech_to_text')
+    writer.flush()
+    assert sample('request_log_write_retries_total') == retries + 1
+    assert writer.pending(1) == 0
+    with app.app_context():
+        assert RequestLog.query.count() == 1
+
+def test_rows_are_dropped_after_the_last_retry(app, writer, api_key):
+    attempts = []
+    writer._write = lambda rows: attempts.append(len(rows))
+    dropped = sample('request_log_rows_dropped_total')
+    writer.submit(1, 1, 'user@example.com', 'speech_to_text', count=2)
+    writer.flush()
+    assert attempts == [2, 2, 2]
+    assert sample('request_log_rows_dropped_total') == dropped + 2
+    assert writer.pending(1) == 0
+    with app.app_context():
+        assert RequestLog.query.count() == 0
@@ -0,0 +1,29 @@
+import io
+from conftest import wav_bytes
+
+def transcribe(client, key):
+    return client.post(
+        '/speech-to-text', headers={'X-API-Key': key, 'Cache-Control': 'no-cache'},
+        data={'audio': (io.BytesIO(wav_bytes()), 'speech.wav')}, content_type='multipart/form-data'
+    )
+
+def test_metrics_report_stage_latencies(client, api_key):
+    assert transcribe(client, api_key).status_code == 200
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    for stage in ('auth', 'quota', 'decode', 'preprocess', 'recognize'):
+        assert f'transcription_stage_seconds_count{{stage="{stage}"}}' in text
+    assert 'http_responses_total{endpoint="speech_to_text",status="200"}' in text
+
+def test_metrics_token(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+def test_server_timing_header(app, client, api_key, monkeypatch):
+    assert 'Server-Timing' not in transcribe(client, api_key).headers
+    monkeypatch.setitem(app.config, 'SERVER_TIMING', True)
+    timing = transcribe(client, api_key).headers['Server-Timing']
+    assert 'recognize;dur=' in timing
@@ -0,0 +1,44 @@
+import io
+import pytest
+from pydub import AudioSegment
+from config import Config
+from conftest import wav_bytes
+from preprocess import preprocess_audio
+
+CONFIG = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+
+def sound(**kwargs):
+    return AudioSegment.from_wav(io.BytesIO(wav_bytes(**kwargs)))
+
+def test_preprocess_downmixes_resamples_and_trims():
+    processed, stats = preprocess_audio(sound(seconds=1, silence=2, rate=44100, channels=2), CONFIG)
+    assert (processed.channels, processed.frame_rate, processed.sample_width) == (1, 16000, 2)
+    # The leading silence is dropped except for the padding kept before the speech
+    assert stats['offset_ms'] == 2000 - Config.PREPROCESS_TRIM_PADDING_MS
+    assert len(processed) == pytest.approx(1000 + Config.PREPROCESS_TRIM_PADDING_MS, abs=20)
+    assert stats['bytes_saved'] == stats['bytes_in'] - stats['bytes_out'] > 0
+
+def test_preprocess_keeps_silence():
+    processed, stats = preprocess_audio(AudioSegment.silent(duration=500, frame_rate=16000), CONFIG)
+    assert len(processed) == 500
+    assert stats['offset_ms'] == 0
+
+def test_preprocess_disabled():
+    processed, stats = preprocess_audio(sound(channels=2), {**CONFIG, 'AUDIO_PREPROCESS': False})
+    assert processed.channels == 1
+    assert processed.frame_rate == 16000
+    assert stats is None
+
+def test_segment_times_refer_to_the_upload(app, client, api_key, monkeypatch):
+    monkeypatch.setitem(app.config, 'LONG_AUDIO_THRESHOLD_MS', 1000)
+    monkeypatch.setitem(app.config, 'SEGMENT_MAX_MS', 1000)
+    response = client.post(
+        '/speech-to-text', headers={'X-API-Key': api_key},
+        data={'audio': (io.BytesIO(wav_bytes(seconds=2.5, silence=2, rate=44100)), 'speech.wav')},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 200
+    assert int(response.headers['X-Audio-Bytes-Saved']) > 0
+    segments = response.get_json()['segments']
+    assert segments[0]['start'] == (2000 - Config.PREPROCESS_TRIM_PADDING_MS) / 1000
+    assert segments[-1]['end'] == 4.5
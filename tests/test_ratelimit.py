@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+import pytest
+from ratelimit import QuotaLimiter, MemoryQuotaStore, SQLiteQuotaStore, create_quota_store
+
+# Counters expire when the month ends, so the tests run in the current one
+MONTH = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+NEXT_MONTH = (MONTH + timedelta(days=31)).replace(day=1)
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryQuotaStore()
+    return SQLiteQuotaStore(str(tmp_path / 'quota.db'))
+
+def test_rate_limit(store):
+    limiter = QuotaLimiter(store, '2 per hour')
+    assert limiter.hit(1, 100, MONTH, None) is None
+    assert limiter.hit(1, 100, MONTH, None) is None
+    assert limiter.hit(1, 100, MONTH, None).name == '2 per 1 hour'
+    # Other keys have their own counters
+    assert limiter.hit(2, 100, MONTH, None) is None
+
+def test_monthly_quota(store):
+    limiter = QuotaLimiter(store, None)
+    for _ in range(3):
+        assert limiter.hit(1, 3, MONTH, None) is None
+    assert limiter.hit(1, 3, MONTH, None).name == 'monthly'
+    assert limiter.hit(1, 3, NEXT_MONTH, None) is None
+
+def test_monthly_seed(store):
+    limiter = QuotaLimiter(store, None)
+    seeds = []
+    def seed():
+        seeds.append(1)
+        return 9
+    assert limiter.hit(1, 10, MONTH, seed) is None
+    assert limiter.hit(1, 10, MONTH, seed).name == 'monthly'
+    # The seed is only read while the counter does not exist
+    assert seeds == [1]
+
+def test_batch_counts_once_against_rate_limits(store):
+    limiter = QuotaLimiter(store, '3 per hour')
+    assert limiter.hit(1, 200, MONTH, None, amount=100) is None
+    assert limiter.hit(1, 200, MONTH, None, amount=100) is None
+    assert limiter.hit(1, 200, MONTH, None, amount=1).name == 'monthly'
+
+def test_rejected_hit_changes_nothing(store):
+    limiter = QuotaLimiter(store, '1 per hour')
+    assert limiter.hit(1, 5, MONTH, None, amount=10).name == 'monthly'
+    # The rate window was not charged for the rejected request
+    assert limiter.hit(1, 5, MONTH, None, amount=5) is None
+
+def test_create_quota_store(tmp_path):
+    assert isinstance(create_quota_store('memory://'), MemoryQuotaStore)
+    assert isinstance(create_quota_store(f"sqlite:///{tmp_path / 'quota.db'}"), SQLiteQuotaStore)
+    with pytest.raises(ValueError):
+        create_quota_store('postgresql://localhost/quota')
@@ -0,0 +1,120 @@
+import pytest
+import speech_recognition as sr
+import resilience
+from backends import RecognitionBackend, ResilientBackend
+from resilience import CircuitBreaker, CircuitOpenError, RetryableRequestError, backoff_delay
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, 'monotonic', lambda: now[0])
+    return now
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(5):
+        for _ in range(100):
+            assert 0 <= backoff_delay(attempt, 0.5) <= 0.5 * 2 ** attempt
+
+def test_breaker_opens_on_error_rate(clock):
+    breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5, reset_timeout=30)
+    assert breaker.record(True) is False
+    assert breaker.record(True) is False
+    assert breaker.record(False) is False
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.record(False) is True
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() is False
+
+def test_breaker_needs_min_calls(clock):
+    breaker = CircuitBreaker(window=10, min_calls=5)
+    for _ in range(4):
+        assert breaker.record(False) is False
+    assert breaker.allow() is True
+
+def test_breaker_half_open_trial(clock):
+    breaker = CircuitBreaker(window=2, min_calls=2, reset_timeout=30)
+    breaker.record(False)
+    breaker.record(False)
+    clock[0] += 29
+    assert breaker.allow() is False
+    clock[0] += 1
+    # One trial call is let through, the others are still rejected while it runs
+    assert breaker.allow() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() is False
+    assert breaker.record(True) is False
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() is True
+
+def test_breaker_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(window=2, min_calls=2, reset_timeout=30)
+    breaker.record(False)
+    breaker.record(False)
+    clock[0] += 30
+    assert breaker.allow() is True
+    assert breaker.record(False) is True
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() is False
+
+class FlakyBackend(RecognitionBackend):
+    name = 'flaky'
+    remote = True
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.errors = []
+
+    def recognize(self, audio_data, language_code):
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'text'
+
+CONFIG = {
+    'RECOGNITION_RETRIES': 2,
+    'RECOGNITION_RETRY_BACKOFF': 0,
+    'RECOGNITION_BREAKER_WINDOW': 2,
+    'RECOGNITION_BREAKER_MIN_CALLS': 2,
+    'RECOGNITION_BREAKER_RESET': 30,
+}
+
+def test_retryable_errors_are_retried():
+    backend = FlakyBackend(CONFIG)
+    backend.errors = [RetryableRequestError('busy'), RetryableRequestError('busy')]
+    config = {**CONFIG, 'RECOGNITION_BREAKER_WINDOW': 20, 'RECOGNITION_BREAKER_MIN_CALLS': 10}
+    assert ResilientBackend(backend, config).recognize(None, 'en-US') == 'text'
+
+def test_other_request_errors_are_not_retried():
+    backend = FlakyBackend(CONFIG)
+    backend.errors = [sr.RequestError('bad request')]
+    with pytest.raises(sr.RequestError):
+        ResilientBackend(backend, CONFIG).recognize(None, 'en-US')
+
+def test_open_circuit_fails_fast(clock):
+    backend = FlakyBackend(CONFIG)
+    resilient = ResilientBackend(backend, {**CONFIG, 'RECOGNITION_RETRIES': 0})
+    backend.errors = [sr.RequestError('down'), sr.RequestError('down')]
+    for _ in range(2):
+        with pytest.raises(sr.RequestError):
+            resilient.recognize(None, 'en-US')
+    with pytest.raises(CircuitOpenError):
+        resilient.recognize(None, 'en-US')
+
+@pytest.mark.parametrize('error', [ValueError('not JSON'), KeyError('result'), OSError('flac')])
+def test_trial_call_failing_unexpectedly_releases_the_circuit(clock, error):
+    backend = FlakyBackend(CONFIG)
+    resilient = ResilientBackend(backend, {**CONFIG, 'RECOGNITION_RETRIES': 0})
+    backend.errors = [sr.RequestError('down'), sr.RequestError('down')]
+    for _ in range(2):
+        with pytest.raises(sr.RequestError):
+            resilient.recognize(None, 'en-US')
+
+    clock[0] += 30
+    backend.errors = [error]
+    with pytest.raises(type(error)):
+        resilient.recognize(None, 'en-US')
+    assert resilient.circuit.state == CircuitBreaker.OPEN
+
+    # Once the service recovers, the next trial closes the circuit again
+    clock[0] += 30
+    assert resilient.recognize(None, 'en-US') == 'text'
+    assert resilient.circuit.state == CircuitBreaker.CLOSED
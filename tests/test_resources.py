@@ -0,0 +1,19 @@
+import io
+from conftest import wav_bytes
+from resources import WorkerResources
+
+def test_init_app_warms_up_the_backends(app):
+    resources = WorkerResources()
+    resources.init_app(app)
+    assert resources.stats()['startup_ms'] > 0
+    assert 'stub' not in resources.warm_up_errors
+
+def test_resource_stats(client, api_key):
+    assert client.get('/resources/stats').status_code == 401
+    before = client.get('/resources/stats', headers={'X-API-Key': api_key}).get_json()['requests']
+    client.post(
+        '/speech-to-text', headers={'X-API-Key': api_key, 'Cache-Control': 'no-cache'},
+        data={'audio': (io.BytesIO(wav_bytes()), 'speech.wav')}, content_type='multipart/form-data'
+    )
+    stats = client.get('/resources/stats', headers={'X-API-Key': api_key}).get_json()
+    assert stats['requests'] == before + 1
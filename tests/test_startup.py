@@ -0,0 +1,29 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('speech_recognition', 'pydub', 'numpy')
+
+def loaded_modules(code):
+    # Runs `code` in a fresh interpreter and returns which of the heavy modules it imported
+    script = f"import sys, json\n{code}\nprint(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=ROOT, env=os.environ, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+@pytest.mark.parametrize('code', [
+    'import models',
+    'import create_account',
+    'import create_db',
+    'import app',
+    'from app import create_app; create_app()',
+])
+def test_startup_does_not_import_audio_modules(code):
+    assert loaded_modules(code) == []
+
+def test_preload_audio_modules():
+    assert loaded_modules('import app; app.preload_audio_modules()') == list(HEAVY_MODULES)
@@ -0,0 +1,90 @@
+import io
+import json
+import struct
+import pytest
+from conftest import wav_bytes
+from streaming import StreamFormatError, stream_parameters
+
+def wav_header(channels=1, rate=16000, bits=16):
+    block_align = channels * bits // 8
+    return (
+        b'RIFF' + struct.pack('<I', 36) + b'WAVE'
+        + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, rate, rate * block_align, block_align, bits)
+        + b'data' + struct.pack('<I', 0)
+    )
+
+def test_pcm_parameters():
+    assert stream_parameters(io.BytesIO(), 'audio/l16', {'rate': '8000', 'channels': '2'}) == (2, 8000, 2)
+    assert stream_parameters(io.BytesIO(), 'audio/l16', {}) == (1, 16000, 2)
+
+@pytest.mark.parametrize('params', [
+    {'rate': 'abc'},
+    {'channels': 'one'},
+    {'rate': '0'},
+    {'rate': '-16000'},
+    {'rate': '1000000'},
+    {'channels': '0'},
+    {'channels': '99'},
+])
+def test_invalid_pcm_parameters(params):
+    with pytest.raises(StreamFormatError):
+        stream_parameters(io.BytesIO(), 'audio/l16', params)
+
+def test_wav_parameters():
+    assert stream_parameters(io.BytesIO(wav_header(2, 44100)), 'audio/wav', {}) == (2, 44100, 2)
+    assert stream_parameters(io.BytesIO(wav_header()), None, {}) == (1, 16000, 2)
+
+@pytest.mark.parametrize('header', [
+    wav_header(channels=0),
+    wav_header(rate=0),
+    wav_header(bits=24),
+])
+def test_invalid_wav_parameters(header):
+    with pytest.raises(StreamFormatError):
+        stream_parameters(io.BytesIO(header), 'audio/wav', {})
+
+def test_unsupported_content_type():
+    with pytest.raises(StreamFormatError):
+        stream_parameters(io.BytesIO(), 'audio/mpeg', {})
+
+def stream(client, key, body, content_type='audio/wav', **query):
+    return client.post(
+        '/speech-to-text/stream', query_string=query, data=body,
+        headers={'X-API-Key': key, 'Content-Type': content_type, 'Accept': 'application/x-ndjson'}
+    )
+
+def test_stream_endpoint(client, api_key, logged_requests):
+    response = stream(client, api_key, wav_bytes(2.5), language='german')
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [event['type'] for event in events] == ['partial'] * (len(events) - 1) + ['final']
+    assert len(events) > 1
+    assert events[-1]['duration'] == 2.5
+    assert 'stub de-DE' in events[-1]['text']
+    assert logged_requests() == 1
+
+def test_stream_sends_server_sent_events_by_default(client, api_key):
+    response = client.post(
+        '/speech-to-text/stream', data=wav_bytes(), headers={'X-API-Key': api_key, 'Content-Type': 'audio/wav'}
+    )
+    assert response.mimetype == 'text/event-stream'
+    assert response.get_data(as_text=True).startswith('event: ')
+
+@pytest.mark.parametrize('content_type', [
+    'audio/l16; rate=abc',
+    'audio/l16; rate=0',
+    'audio/l16; channels=0',
+    'audio/mpeg',
+])
+def test_invalid_stream_is_not_charged(client, api_key, logged_requests, content_type):
+    response = stream(client, api_key, b'\0\0' * 16000, content_type)
+    assert response.status_code == 400
+    assert logged_requests() == 0
+
+def test_stream_longer_than_the_plan_allows(client, api_key, monkeypatch):
+    import app as server
+    monkeypatch.setitem(server.PLAN_MAX_DURATION, 'free', 1)
+    response = stream(client, api_key, b'\0\0' * 16000 * 3, 'audio/l16; rate=16000')
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert events[-1]['type'] == 'error'
+    assert events[-1]['status'] == 413
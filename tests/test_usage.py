@@ -0,0 +1,56 @@
+from datetime import date, datetime
+import pytest
+from config import Config
+from models import create_db_app, db, User, APIKey, UsageRollup
+from usage import increment_rollups
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+
+    app = create_db_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(email='user@example.com', jwt_token='token')
+        db.session.add(user)
+        db.session.commit()
+        db.session.add_all([APIKey(key='a' * 50, user_id=user.id), APIKey(key='b' * 50, user_id=user.id)])
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+def row(api_key_id, timestamp, endpoint='speech_to_text'):
+    return {'api_key_id': api_key_id, 'user_id': 1, 'endpoint': endpoint, 'timestamp': timestamp}
+
+def rollups():
+    return sorted(
+        (r.api_key_id, r.month, r.endpoint, r.request_count) for r in UsageRollup.query
+    )
+
+def test_increment_rollups(app):
+    increment_rollups([
+        row(1, datetime(2024, 5, 3)),
+        row(1, datetime(2024, 5, 31, 23, 59)),
+        row(1, datetime(2024, 6, 1)),
+        row(2, datetime(2024, 5, 3)),
+        row(1, datetime(2024, 5, 3), 'speech_to_text_batch'),
+    ])
+    db.session.commit()
+    assert rollups() == [
+        (1, date(2024, 5, 1), 'speech_to_text', 2),
+        (1, date(2024, 5, 1), 'speech_to_text_batch', 1),
+        (1, date(2024, 6, 1), 'speech_to_text', 1),
+        (2, date(2024, 5, 1), 'speech_to_text', 1),
+    ]
+
+def test_increment_rollups_adds_to_existing_counts(app):
+    increment_rollups([row(1, datetime(2024, 5, 3))] * 3)
+    db.session.commit()
+    increment_rollups([row(1, datetime(2024, 5, 4))] * 2)
+    db.session.commit()
+    assert rollups() == [(1, date(2024, 5, 1), 'speech_to_text', 5)]
+
+def test_increment_rollups_without_rows(app):
+    increment_rollups([])
+    assert rollups() == []
@@ -0,0 +1,146 @@
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import cast, func
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from models import db, User, RequestLog, UsageRollup
+
+def month_of(timestamp):
+    return timestamp.date().replace(day=1)
+
+def increment_rollups(rows):
+    # Fold a batch of RequestLog rows into UsageRollup within the caller's transaction. Worker
+    # processes flush concurrently, so the first count of a month is an atomic upsert rather
+    # than an UPDATE followed by an INSERT that another worker may have beaten
+    counts = Counter(
+        (row['api_key_id'], row['user_id'], month_of(row['timestamp']), row['endpoint'])
+        for row in rows
+    )
+    values = [
+        {'api_key_id': api_key_id, 'user_id': user_id, 'month': month, 'endpoint': endpoint, 'request_count': count}
+        for (api_key_id, user_id, month, endpoint), count in counts.items()
+    ]
+    if not values:
+        return
+
+    table = UsageRollup.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert(table)
+        db.session.execute(insert.on_conflict_do_update(
+            index_elements=['api_key_id', 'month', 'endpoint'],
+            set_={'request_count': table.c.request_count + insert.excluded.request_count}
+        ), values)
+    elif dialect in ('mysql', 'mariadb'):
+        insert = mysql.insert(table)
+        db.session.execute(insert.on_duplicate_key_update(
+            request_count=table.c.request_count + insert.inserted.request_count
+        ), values)
+    else:
+        for value in values:
+            _increment_rollup(value)
+
+def _increment_rollup(value):
+    # Fallback for databases without an upsert: an INSERT that lost the race to another worker
+    # is undone by its savepoint and the row it collided with is updated instead
+    for _ in range(2):
+        updated = UsageRollup.query.filter_by(
+            api_key_id=value['api_key_id'], month=value['month'], endpoint=value['endpoint']
+        ).update(
+            {UsageRollup.request_count: UsageRollup.request_count + value['request_count']},
+            synchronize_session=False
+        )
+        if updated:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(UsageRollup.__table__.insert(), value)
+            return
+        except IntegrityError:
+            continue
+    raise RuntimeError("Could not update usage rollup")
+
+def monthly_usage(api_key_id, month):
+    return db.session.query(
+        func.coalesce(func.sum(UsageRollup.request_count), 0)
+    ).filter(
+        UsageRollup.api_key_id == api_key_id,
+        UsageRollup.month == month
+    ).scalar()
+
+def _month_expression(column):
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return func.date(column, 'start of month')
+    if dialect in ('mysql', 'mariadb'):
+        return cast(func.date_format(column, '%Y-%m-01'), db.Date)
+    if dialect == 'mssql':
+        return func.datefromparts(func.year(column), func.month(column), 1)
+    return cast(func.date_trunc('month', column), db.Date)
+
+def backfill_usage_rollups():
+    # Rebuild UsageRollup from RequestLog in a single INSERT ... SELECT
+    month = _month_expression(RequestLog.timestamp)
+    select = db.session.query(
+        RequestLog.api_key_id,
+        RequestLog.user_id,
+        month,
+        RequestLog.endpoint,
+        func.count(RequestLog.id)
+    ).group_by(
+        RequestLog.api_key_id, RequestLog.user_id, month, RequestLog.endpoint
+    )
+
+    db.session.query(UsageRollup).delete(synchronize_session=False)
+    db.session.execute(UsageRollup.__table__.insert().from_select(
+        ['api_key_id', 'user_id', 'month', 'endpoint', 'request_count'],
+        select.statement
+    ))
+    db.session.commit()
+    return UsageRollup.query.count()
+
+USER_REPORT_COLUMNS = ['user_id', 'email', 'subscription_plan', 'month', 'requests']
+KEY_REPORT_COLUMNS = ['api_key_id', 'user_id', 'email', 'subscription_plan', 'month', 'endpoint', 'requests']
+
+def _next_month(month):
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+def usage_report(by='user', start=None, end=None, from_logs=False):
+    # Monthly request counts per user, or per API key and endpoint, between the `start` and `end`
+    # months (inclusive). Rows come from UsageRollup, or with `from_logs` are recounted from
+    # RequestLog, ordered along the indexes on (user_id, month) and (api_key_id, month, endpoint)
+    # and fetched in chunks so large exports can be streamed. Returns (columns, query).
+    if from_logs:
+        month = _month_expression(RequestLog.timestamp)
+        requests = func.count(RequestLog.id)
+        source = RequestLog
+        filters = []
+        if start:
+            filters.append(RequestLog.timestamp >= datetime.combine(start, datetime.min.time()))
+        if end:
+            filters.append(RequestLog.timestamp < datetime.combine(_next_month(end), datetime.min.time()))
+    else:
+        month = UsageRollup.month
+        requests = func.sum(UsageRollup.request_count)
+        source = UsageRollup
+        filters = []
+        if start:
+            filters.append(UsageRollup.month >= start)
+        if end:
+            filters.append(UsageRollup.month <= end)
+
+    if by == 'user':
+        columns = USER_REPORT_COLUMNS
+        groups = [source.user_id, month]
+        details = [User.email, User.subscription_plan]
+        selected = [source.user_id, *details, month, requests]
+    else:
+        columns = KEY_REPORT_COLUMNS
+        groups = [source.api_key_id, month, source.endpoint]
+        details = [source.user_id, User.email, User.subscription_plan]
+        selected = [source.api_key_id, *details, month, source.endpoint, requests]
+
+    query = db.session.query(*selected).join(User, User.id == source.user_id).filter(*filters).group_by(
+        *groups, *details
+    ).order_by(*groups)
+    return columns, query.execution_options(stream_results=True).yield_per(1000)